@@ -1,22 +1,500 @@
-import sys, csv, sqlite3, datetime, shutil, os
-from PyQt6.QtWidgets import *
-from PyQt6.QtGui import *
-from PyQt6.QtCore import *
+import time
+
+STARTUP_STARTED = time.perf_counter()
+
+import sys, csv, sqlite3, datetime, os, re, heapq, bisect, hashlib, json, gzip, queue, threading, atexit, contextlib
+import io, argparse, itertools, pathlib
+import collections, functools
+from PyQt6.QtWidgets import (QAbstractItemView, QApplication, QCalendarWidget, QCheckBox, QComboBox, QDateEdit,
+                             QDateTimeEdit, QDialog, QFileDialog, QGroupBox, QHBoxLayout, QHeaderView, QInputDialog,
+                             QLabel, QLineEdit, QListWidget, QListWidgetItem, QMainWindow, QMenu, QMessageBox,
+                             QPlainTextEdit, QProgressBar, QProgressDialog, QPushButton, QSplitter, QStatusBar,
+                             QTableView, QTextEdit, QVBoxLayout, QWidget)
+from PyQt6.QtGui import QColor, QKeySequence, QShortcut, QTextCharFormat
+from PyQt6.QtCore import (QAbstractTableModel, QDate, QDateTime, QMetaObject, QModelIndex, QObject, QThread, QTimer,
+                          Qt, pyqtSignal, pyqtSlot)
+
+# Замеры холодного старта в мс от начала импорта модуля: import, db_open, first_paint, ready
+STARTUP_TIMES = {"import_ms": round((time.perf_counter() - STARTUP_STARTED) * 1000, 2)}
 
 DB_NAME, LOG_FILE, BACKUP_DIR = "tasks.db", "activity.log", "backups"
+TASK_FIELDS = "id, title, description, priority, status, created, deadline, reminder"
+POLL_CHANGES_MS = 1000  # как часто проверять правки других процессов в той же базе
+BACKUP_KEEP, AUTO_BACKUP_MINUTES = 5, 60  # сколько бэкапов хранить и как часто делать их сами (0 - не делать)
+PRIORITIES, STATUSES = ("Низкий", "Средний", "Высокий"), ("В процессе", "Готово")
+RECURRENCES = {"daily": "Каждый день", "weekly": "Каждую неделю", "monthly": "Каждый месяц"}
+RECURRENCE_HORIZON_DAYS = 62  # насколько вперёд планировщик ищет следующее напоминание повторяющейся задачи
+ARCHIVE_DAYS, ARCHIVE_BATCH = 180, 2000  # возраст выполненных задач для архива и размер пачки переноса
+FIRST_PAGE, PAGE_SIZE = 100, 500  # первый экран до отрисовки окна и страница подгрузки при прокрутке
+SLOW_MS, PROFILE_FILE = 100, "profile.json"  # порог медленного запроса/вызова и файл отчёта профилировщика
+
+
+class ActivityLogger:
+    # Записи копятся в очереди и пишутся пачками фоновым потоком; файл ротируется
+    # по размеру или возрасту: activity.log -> activity.log.1 -> ... -> activity.log.<backup_count>
+    def __init__(self, path=LOG_FILE, max_bytes=5 * 1024 * 1024, max_age_days=30, backup_count=3,
+                 flush_interval=1.0, batch_size=500):
+        self.path, self.max_bytes, self.max_age = path, max_bytes, datetime.timedelta(days=max_age_days)
+        self.backup_count, self.flush_interval, self.batch_size = backup_count, flush_interval, batch_size
+        self.records, self.thread, self.file, self.started = queue.Queue(), None, None, None
+        self.lock = threading.Lock()
+
+    def write(self, message, **fields):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name="activity-log", daemon=True)
+                    self.thread.start()
+        self.records.put((time.time(), message, fields))
+
+    def close(self):
+        if self.thread is not None:
+            self.records.put(None)
+            self.thread.join()
+            self.thread = None
+
+    @staticmethod
+    def format(record):
+        created, message, fields = record
+        line = f"[{datetime.datetime.fromtimestamp(created).strftime('%Y-%m-%d %H:%M:%S')}] {message}"
+        if fields: line += " | " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line + "\n"
+
+    def run(self):
+        stop = False
+        while not stop:
+            try:
+                batch = [self.records.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stop = True
+                batch = [record for record in batch if record is not None]
+            try:
+                self.flush(batch)
+            except OSError:
+                self.file = None  # лог не должен ронять приложение
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def flush(self, batch):
+        if not batch: return
+        if self.file is None: self.open()
+        self.file.write("".join(map(self.format, batch)))
+        self.file.flush()
+        if self.file.tell() >= self.max_bytes or datetime.datetime.now() - self.started >= self.max_age:
+            self.rotate()
+
+    def open(self):
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.started = datetime.datetime.now()
+        try:  # возраст файла - по времени его первой записи
+            with open(self.path, encoding="utf-8") as f:
+                self.started = datetime.datetime.strptime(f.read(21)[1:20], '%Y-%m-%d %H:%M:%S')
+        except (OSError, ValueError):
+            pass
+
+    def rotate(self):
+        self.file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"): os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backup_count:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.open()
+
+
+ACTIVITY_LOG = ActivityLogger()
+atexit.register(ACTIVITY_LOG.close)
+
+
+def log(message, **fields):
+    ACTIVITY_LOG.write(message, **fields)
+
+
+def day_number(date):
+    # Даты хранятся как номер дня от 1970-01-01, чтобы сравнивать их как целые числа
+    return date.toordinal() - 719163
+
+
+def day_date(day):
+    return datetime.date.fromordinal(day + 719163)
+
 
+def occurrences(rule, start, first, last):
+    # Дни повторений серии с правилом rule и первым днём start в отрезке [first, last] - номера дней;
+    # ежемесячная серия с 31-го числа в коротких месяцах приходится на последний день
+    first = max(first, start)
+    if rule == "daily": return list(range(first, last + 1))
+    if rule == "weekly": return list(range(first + (start - first) % 7, last + 1, 7))
+    if rule != "monthly": return []
+    anchor, month, days = day_date(start).day, day_date(first).replace(day=1), []
+    while day_number(month) <= last:
+        following = (month + datetime.timedelta(days=31)).replace(day=1)
+        day = day_number(month) + min(anchor, (following - month).days) - 1
+        if first <= day <= last: days.append(day)
+        month = following
+    return days
 
-def log(message):
-    try:
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}\n")
-    except Exception:
-        pass
+
+def next_occurrence(rule, start, after, skip=()):
+    # Первое повторение позже дня after, не попавшее в skip; None - правило неизвестно
+    # (строку task_recurrence мог записать внешний скрипт), повторений у него нет
+    if rule not in RECURRENCES: return None
+    first = after + 1
+    while True:
+        for day in occurrences(rule, start, first, first + 62):
+            if day not in skip: return day
+        first += 63
+
+
+def elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+class Profiler:
+    # Включается флагом --profile или ELA_PROFILE=1. Выключенный почти ничего не стоит: обёртки
+    # @profiled сразу зовут функцию, а соединения открываются без профилирующего курсора
+    def __init__(self, enabled=False, slow_ms=SLOW_MS, keep=500):
+        self.enabled, self.slow_ms, self.keep = enabled, slow_ms, keep
+        self.timings, self.counters = {"calls": {}, "queries": {}}, {}
+        self.lock = threading.Lock()
+
+    def record(self, kind, name, ms):
+        with self.lock:
+            samples = self.timings[kind].get(name)
+            if samples is None:
+                samples = self.timings[kind][name] = collections.deque(maxlen=self.keep)
+            samples.append(ms)
+        if ms >= self.slow_ms:
+            log("Медленный запрос" if kind == "queries" else "Медленный вызов", op=f"slow_{kind}",
+                duration_ms=round(ms, 2), name=name[:300])
+
+    def count(self, name, n=1):
+        if not self.enabled: return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def trace(self, sql):
+        # Колбэк sqlite3 вызывается на каждый оператор, включая шаги триггеров
+        self.count("sql_statements")
+
+    def reset(self):
+        with self.lock:
+            self.timings, self.counters = {"calls": {}, "queries": {}}, {}
+
+    @staticmethod
+    def percentiles(samples):
+        ordered = sorted(samples)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+        return {"count": len(ordered), "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": pick(1)}
+
+    def snapshot(self, top=30):
+        with self.lock:
+            timings = {kind: {name: list(samples) for name, samples in group.items()}
+                       for kind, group in self.timings.items()}
+            report = {"enabled": self.enabled, "slow_ms": self.slow_ms, "counters": dict(self.counters)}
+        for kind, group in timings.items():
+            stats = sorted(((name, self.percentiles(samples)) for name, samples in group.items()),
+                           key=lambda item: -item[1]["p90"])
+            report[kind] = dict(stats[:top])  # самые медленные по p90 - первыми
+        return report
+
+    def dump(self, path=PROFILE_FILE):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=1)
+
+
+PROFILER = Profiler(enabled="--profile" in sys.argv or os.environ.get("ELA_PROFILE") == "1")
+
+
+def profiled(func):
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not PROFILER.enabled: return func(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            PROFILER.record("calls", name, (time.perf_counter() - started) * 1000)
+    return wrapper
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    # Время запроса - выполнение плюс выборка строк; запрос засчитывается, когда курсор
+    # исчерпан, закрыт, собран или выполняет следующий запрос
+    sql, spent, fetched = None, 0.0, 0
+
+    def timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.spent += time.perf_counter() - started
+
+    def begin(self, sql):
+        self.finish()
+        self.sql, self.spent, self.fetched = " ".join(sql.split()), 0.0, 0
+
+    def finish(self):
+        if self.sql is None: return
+        PROFILER.record("queries", self.sql, self.spent * 1000)
+        if self.fetched: PROFILER.count("rows_fetched", self.fetched)
+        self.sql = None
+
+    def execute(self, sql, params=()):
+        self.begin(sql)
+        self.timed(super().execute, sql, params)
+        if self.description is None: self.finish()
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self.begin(sql)
+        self.timed(super().executemany, sql, seq_of_params)
+        self.finish()
+        return self
+
+    def fetchone(self):
+        row = self.timed(super().fetchone)
+        if row is None:
+            self.finish()
+        else:
+            self.fetched += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self.timed(super().fetchmany, size)
+        self.fetched += len(rows)
+        if len(rows) < size: self.finish()
+        return rows
+
+    def fetchall(self):
+        rows = self.timed(super().fetchall)
+        self.fetched += len(rows)
+        self.finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self.timed(super().__next__)
+        except StopIteration:
+            self.finish()
+            raise
+        self.fetched += 1
+        return row
+
+    def close(self):
+        self.finish()
+        super().close()
+
+    def __del__(self):
+        self.finish()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    # Connection.execute создаёт курсор в обход cursor(), поэтому переопределены все три
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+def connect_db(path=DB_NAME, **kwargs):
+    # sqlite3 кэширует подготовленные запросы по тексту SQL, поэтому горячие запросы -
+    # неизменные строки-константы, а кэш увеличен
+    kwargs.setdefault("cached_statements", 256)
+    if PROFILER.enabled: kwargs.setdefault("factory", ProfiledConnection)
+    conn = sqlite3.connect(path, **kwargs)
+    if PROFILER.enabled: conn.set_trace_callback(PROFILER.trace)
+    # WAL: читатели не ждут писателя, а synchronous=NORMAL не делает fsync на каждый коммит
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA cache_size = -20000")
+    conn.execute("PRAGMA mmap_size = 268435456")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    # lower() в SQLite понимает только ASCII, для кириллицы нужен питоновский
+    conn.create_function("py_lower", 1, lambda v: v.lower() if v else "", deterministic=True)
+    return conn
+
+
+TYPED_DATES = """deadline_day = CAST(strftime('%s', {0}deadline) AS INTEGER) / 86400,
+                 reminder_ts = CAST(strftime('%s', {0}reminder, 'utc') AS INTEGER),
+                 created_ts = CAST(strftime('%s', {0}created, 'utc') AS INTEGER)"""
+
+
+def migrate_typed_dates(conn):
+    # Дедлайн - номер дня (см. day_number), напоминание и создание - unix-время;
+    # строковые поля остаются для интерфейса, а числовые ведут триггеры
+    for column in ("deadline_day", "reminder_ts", "created_ts"):
+        conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} INTEGER")
+    conn.execute(f"UPDATE tasks SET {TYPED_DATES.format('')}")
+    conn.execute(f"""CREATE TRIGGER tasks_typed_ai AFTER INSERT ON tasks BEGIN
+        UPDATE tasks SET {TYPED_DATES.format('new.')} WHERE id = new.id; END""")
+    conn.execute(f"""CREATE TRIGGER tasks_typed_au AFTER UPDATE OF deadline, reminder, created ON tasks
+        WHEN new.deadline IS NOT old.deadline OR new.reminder IS NOT old.reminder OR new.created IS NOT old.created
+        BEGIN UPDATE tasks SET {TYPED_DATES.format('new.')} WHERE id = new.id; END""")
+    conn.execute("DROP INDEX IF EXISTS idx_tasks_reminder")
+    conn.execute("DROP INDEX IF EXISTS idx_tasks_open_deadline")
+    conn.execute("CREATE INDEX idx_tasks_deadline_day ON tasks(deadline_day)")
+    conn.execute("CREATE INDEX idx_tasks_reminder_ts ON tasks(reminder_ts) WHERE reminder_ts IS NOT NULL")
+    # Частичный индекс под счётчик просроченных: в нём только незавершённые задачи
+    conn.execute("CREATE INDEX idx_tasks_open_deadline_day ON tasks(deadline_day) WHERE status <> 'Готово'")
+
+
+# Ключи сортировки по столбцам таблицы - типизированные выражения под индексы из migrate_sort_keys;
+# пустое значение заменено максимальным, чтобы keyset-сравнение (ключ, id) > (?, ?) не спотыкалось о NULL;
+# NULL в тексте (внешние скрипты, дельта) - пустая строка, как в TaskTableModel.sort_key
+NO_VALUE = 9223372036854775807
+PRIORITY_RANK = f"CASE priority {' '.join(f'WHEN {p!r} THEN {i}' for i, p in enumerate(PRIORITIES))} ELSE 3 END"
+SORT_KEYS = ("id", "IFNULL(title, '')", "IFNULL(description, '')", PRIORITY_RANK, "IFNULL(status, '')",
+             f"IFNULL(created_ts, {NO_VALUE})",
+             f"IFNULL(deadline_day, {NO_VALUE})", f"IFNULL(reminder_ts, {NO_VALUE})")
+
+
+def migrate_sort_keys(conn):
+    # ORDER BY ключ, id и переход к следующей странице идут по индексу без сортировки выборки
+    # (rowid в индексе SQLite есть всегда); статус уже покрыт idx_tasks_status, описание - длинный
+    # текст, его индекс стоил бы дороже редкой сортировки по нему
+    for column, key in zip(TASK_FIELDS.split(", "), SORT_KEYS):
+        if column in ("title", "priority", "created", "deadline", "reminder"):
+            conn.execute(f"CREATE INDEX idx_tasks_sort_{column} ON tasks({key})")
+
+
+BUMP_REVISION = "UPDATE task_stats SET value = value + 1 WHERE key = 'revision';"
+CURRENT_REVISION = "(SELECT value FROM task_stats WHERE key = 'revision')"
+
+
+def migrate_revisions(conn):
+    # Ревизия - общий счётчик правок (ключ 'revision' в task_stats): каждая вставка и правка задачи
+    # получает новую, удаление оставляет надгробие с ревизией - другие процессы дочитывают только новое
+    conn.execute("ALTER TABLE tasks ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX idx_tasks_revision ON tasks(revision)")
+    conn.execute("CREATE TABLE task_tombstones (id INTEGER PRIMARY KEY, revision INTEGER NOT NULL, deadline TEXT)")
+    conn.execute("CREATE INDEX idx_task_tombstones_revision ON task_tombstones(revision)")
+    conn.execute("INSERT OR IGNORE INTO task_stats VALUES ('revision', 0)")
+    conn.execute(f"""CREATE TRIGGER tasks_revision_ai AFTER INSERT ON tasks BEGIN
+        {BUMP_REVISION} UPDATE tasks SET revision = {CURRENT_REVISION} WHERE id = new.id; END""")
+    conn.execute(f"""CREATE TRIGGER tasks_revision_au
+        AFTER UPDATE OF title, description, priority, status, created, deadline, reminder ON tasks BEGIN
+        {BUMP_REVISION} UPDATE tasks SET revision = {CURRENT_REVISION} WHERE id = new.id; END""")
+    conn.execute(f"""CREATE TRIGGER tasks_revision_ad AFTER DELETE ON tasks BEGIN
+        {BUMP_REVISION} INSERT OR REPLACE INTO task_tombstones VALUES (old.id, {CURRENT_REVISION}, old.deadline);
+        END""")
+
+
+def migrate_recurrence(conn):
+    # Повторяющаяся задача - одна строка tasks, её дедлайн стоит на ближайшем невыполненном повторении,
+    # правило хранится один раз в task_recurrence. Остальные повторения не материализуются: их
+    # разворачивает occurrences только на просматриваемый отрезок, а выполненные - исключения в task_occurrences
+    conn.execute("""CREATE TABLE task_recurrence (task_id INTEGER PRIMARY KEY, rule TEXT NOT NULL,
+        start_day INTEGER NOT NULL)""")
+    conn.execute("""CREATE TABLE task_occurrences (task_id INTEGER NOT NULL, day INTEGER NOT NULL,
+        PRIMARY KEY (task_id, day)) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX idx_task_occurrences_day ON task_occurrences(day)")
+    conn.execute("""CREATE TRIGGER tasks_recurrence_ad AFTER DELETE ON tasks BEGIN
+        DELETE FROM task_recurrence WHERE task_id = old.id; DELETE FROM task_occurrences WHERE task_id = old.id; END""")
+    # Выполненное повторение идёт в недельную статистику так же, как выполненная задача
+    conn.execute("""CREATE TRIGGER task_occurrences_done AFTER INSERT ON task_occurrences BEGIN
+        INSERT INTO task_stats VALUES ('week:' || date('now', 'localtime', 'weekday 0', '-6 days'), 1)
+            ON CONFLICT(key) DO UPDATE SET value = value + 1; END""")
+
+
+def archive_path(path=DB_NAME):
+    return os.path.splitext(path)[0] + "_archive.db"
+
+
+ARCHIVE_FIELDS = f"{TASK_FIELDS}, deadline_day, reminder_ts, created_ts, uuid"
+
+
+def attach_archive(conn, path=DB_NAME):
+    # Архив выполненных задач - отдельный файл рядом с базой (tasks.db -> tasks_archive.db), подключённый
+    # к соединению схемой archive. Колонки и индексы сортировки как у tasks, id сохраняются; триггеров нет -
+    # архив только пополняется переносом и читается в режиме "с архивом"
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path(path),))
+    conn.execute("PRAGMA archive.journal_mode = WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS archive.tasks (
+        id INTEGER PRIMARY KEY, title TEXT NOT NULL, description TEXT, priority TEXT, status TEXT, created TEXT,
+        deadline TEXT, reminder TEXT, deadline_day INTEGER, reminder_ts INTEGER, created_ts INTEGER, archived TEXT,
+        uuid TEXT)""")
+    if not any(column[1] == "uuid" for column in conn.execute("PRAGMA archive.table_info(tasks)")):
+        conn.execute("ALTER TABLE archive.tasks ADD COLUMN uuid TEXT")  # архив, созданный до migrate_uuids
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_tasks_deadline_day ON tasks(deadline_day)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_tasks_uuid ON tasks(uuid)")  # для дельты
+    indexes = dict(conn.execute("SELECT name, sql FROM archive.sqlite_master WHERE type = 'index'"))
+    for column, key in zip(TASK_FIELDS.split(", "), SORT_KEYS):
+        if column in ("title", "status", "priority", "created", "deadline", "reminder"):
+            name = f"idx_tasks_sort_{column}"
+            if name in indexes and key not in indexes[name]:
+                conn.execute(f"DROP INDEX archive.{name}")  # индекс по прежнему ключу, до migrate_text_sort_keys
+            conn.execute(f"CREATE INDEX IF NOT EXISTS archive.{name} ON tasks({key})")
+    conn.commit()
+
+
+def migrate_uuids(conn):
+    # Постоянный uuid задачи для синхронизации между базами: id у каждой базы свой, а дельта
+    # (DeltaExportWorker) ссылается на задачу по uuid. Новой строке его выдаёт тот же триггер,
+    # что считает даты, - без лишнего UPDATE на вставку; надгробие запоминает uuid удалённой задачи
+    new_uuid = "lower(hex(randomblob(16)))"
+    conn.execute("ALTER TABLE tasks ADD COLUMN uuid TEXT")
+    conn.execute(f"UPDATE tasks SET uuid = {new_uuid}")
+    conn.execute("CREATE UNIQUE INDEX idx_tasks_uuid ON tasks(uuid)")
+    conn.execute("DROP TRIGGER tasks_typed_ai")
+    conn.execute(f"""CREATE TRIGGER tasks_typed_ai AFTER INSERT ON tasks BEGIN
+        UPDATE tasks SET {TYPED_DATES.format('new.')}, uuid = IFNULL(new.uuid, {new_uuid}) WHERE id = new.id; END""")
+    conn.execute("ALTER TABLE task_tombstones ADD COLUMN uuid TEXT")
+    conn.execute("DROP TRIGGER tasks_revision_ad")
+    conn.execute(f"""CREATE TRIGGER tasks_revision_ad AFTER DELETE ON tasks BEGIN
+        {BUMP_REVISION} INSERT OR REPLACE INTO task_tombstones (id, revision, deadline, uuid)
+        VALUES (old.id, {CURRENT_REVISION}, old.deadline, old.uuid); END""")
+
+
+def migrate_text_sort_keys(conn):
+    # Текстовые ключи сортировки стали IFNULL(столбец, ''): индексы пересоздаются под новые выражения,
+    # у статуса появляется свой - idx_tasks_status по голому столбцу остаётся фильтрам
+    for column, key in (("title", SORT_KEYS[1]), ("status", SORT_KEYS[4])):
+        conn.execute(f"DROP INDEX IF EXISTS idx_tasks_sort_{column}")
+        conn.execute(f"CREATE INDEX idx_tasks_sort_{column} ON tasks({key})")
+
+
+# Версия схемы хранится в PRAGMA user_version: миграция N переводит базу с версии N-1 на N
+MIGRATIONS = [migrate_typed_dates, migrate_sort_keys, migrate_revisions, migrate_recurrence, migrate_uuids,
+              migrate_text_sort_keys]
 
 
 class TaskDB:
-    def __init__(self):
-        self.conn = None
+    INSERT_SQL = """INSERT INTO tasks (title, description, priority, status, created, deadline, reminder)
+        VALUES (?,?,?,?,?,?,?)"""
+    UPDATE_SQL = """UPDATE tasks SET title=?, description=?, priority=?,
+        status=?, deadline=?, reminder=? WHERE id=?"""
+    DELETE_SQL = "DELETE FROM tasks WHERE id=?"
+    GET_SQL = f"SELECT {TASK_FIELDS} FROM tasks WHERE id = ?"
+
+    def __init__(self, path=DB_NAME, error_handler=None):
+        # error_handler(заголовок, текст) решает, как показать ошибку; без него ошибка идёт в лог,
+        # так что TaskDB не зависит от виджетов и работает из потоков и скриптов
+        self.path, self.error_handler = path, error_handler
+        self.conn, self.fts = None, False
+        # Подписчики получают список изменений [(вид, старая строка, новая строка)],
+        # вид - "inserted", "updated" или "deleted"; ("reloaded", None, None) - изменено
+        # неизвестное множество строк (групповая операция по фильтру), данные надо перечитать
+        self.change_listeners = []
+        self.tx_depth, self.tx_failed, self.pending_changes = 0, False, []
+        # Последние увиденные PRAGMA data_version и ревизия - по ним poll_changes находит чужие правки
+        self.data_version, self.revision = None, 0
         self.connect()
         self.create_backup_dir()
 
@@ -25,10 +503,57 @@ class TaskDB:
 
     def connect(self):
         try:
-            self.conn = sqlite3.connect(DB_NAME)
+            self.conn = connect_db(self.path)
             self.create_table()
+            attach_archive(self.conn, self.path)
+            self.reserve_archived_ids()
         except sqlite3.Error as e:
-            QMessageBox.critical(None, "Ошибка БД", f"Не удалось подключиться: {e}")
+            self.report_error("Ошибка БД", f"Не удалось подключиться: {e}")
+
+    def reserve_archived_ids(self):
+        # Id архивных задач не должны достаться новым: счётчик AUTOINCREMENT не ниже максимального id архива.
+        # Сбивается, когда база восстановлена из бэкапа, снятого до переноса в архив
+        top = self.conn.execute("""SELECT (SELECT MAX(id) FROM archive.tasks),
+            (SELECT seq FROM sqlite_sequence WHERE name = 'tasks')""").fetchone()
+        if top[0] is None or top[0] <= (top[1] or 0): return  # обычный случай - без записи при каждом старте
+        with self.conn:
+            if top[1] is None:
+                self.conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('tasks', ?)", (top[0],))
+            else:
+                self.conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'tasks'", (top[0],))
+
+    def report_error(self, title, message):
+        if self.error_handler:
+            self.error_handler(title, message)
+        else:
+            log(f"{title}: {message}", op="error")
+
+    def close(self):
+        if self.conn:
+            self.conn.execute("PRAGMA optimize")
+            self.conn.close()
+            self.conn = None
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # Единица работы: вложенные вызовы объединяются, коммит и события изменений -
+        # один раз при выходе из внешнего блока; любая ошибка откатывает всё
+        self.tx_depth += 1
+        try:
+            yield self.conn
+            if self.tx_depth == 1 and not self.tx_failed:
+                self.conn.commit()
+                self.skip_own_revisions()
+                changes, self.pending_changes = self.pending_changes, []
+                if changes: self.notify(changes)
+        except BaseException:
+            self.tx_failed = True
+            raise
+        finally:
+            self.tx_depth -= 1
+            if self.tx_depth == 0 and self.tx_failed:
+                self.conn.rollback()
+                self.pending_changes, self.tx_failed = [], False
 
     def create_table(self):
         self.conn.execute("""
@@ -37,100 +562,1673 @@ class TaskDB:
                 title TEXT NOT NULL, description TEXT, priority TEXT,
                 status TEXT, created TEXT, deadline TEXT, reminder TEXT
             )""")
+        for column in ("status", "priority", "deadline"):
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_{column} ON tasks({column})")
+        self.create_fts()
+        self.create_stats()
         self.conn.commit()
+        self.migrate()
+        self.mark_seen()
+
+    def migrate(self):
+        while self.conn.execute("PRAGMA user_version").fetchone()[0] < len(MIGRATIONS):
+            # DDL в sqlite3 не открывает транзакцию сам, поэтому BEGIN явный - миграция атомарна.
+            # Версия перечитывается под блокировкой: второй экземпляр, дождавшийся первого,
+            # не должен повторять уже применённые миграции
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                number = self.conn.execute("PRAGMA user_version").fetchone()[0] + 1
+                if number <= len(MIGRATIONS):
+                    MIGRATIONS[number - 1](self.conn)
+                    self.conn.execute(f"PRAGMA user_version = {number}")
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+            if number <= len(MIGRATIONS): log(f"Схема базы обновлена до версии {number}", op="migrate")
+
+    def current_revision(self):
+        row = self.conn.execute("SELECT value FROM task_stats WHERE key = 'revision'").fetchone()
+        return row[0] if row else 0
+
+    def mark_seen(self):
+        self.data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        self.revision = self.current_revision()
+
+    def skip_own_revisions(self):
+        # Свои коммиты data_version не меняют: если чужих не было, все новые ревизии - наши,
+        # и poll_changes не должен присылать их обратно. Ревизия читается раньше data_version,
+        # так что чужой коммит между ними получит ревизию больше запомненной и не потеряется
+        try:
+            revision = self.current_revision()
+            if self.conn.execute("PRAGMA data_version").fetchone()[0] == self.data_version:
+                self.revision = revision
+        except sqlite3.Error:
+            pass
+
+    @profiled
+    def poll_changes(self, limit=1000):
+        # Правки других процессов и соединений: PRAGMA data_version меняется при их коммитах, а строки,
+        # изменённые после последней увиденной ревизии, находятся по индексу. Подписчики получают
+        # ("updated", None, строка) - прежняя строка неизвестна - и ("deleted", (id, ..., дедлайн, None), None)
+        if self.tx_depth: return False
+        try:
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self.data_version: return False
+            self.data_version, revision = version, self.current_revision()
+            if revision == self.revision: return False
+            if revision < self.revision:
+                changes = [("reloaded", None, None)]  # базу подменили, например восстановили из бэкапа
+            else:
+                rows = self.conn.execute(f"SELECT {TASK_FIELDS} FROM tasks WHERE revision > ? LIMIT ?",
+                                         (self.revision, limit + 1)).fetchall()
+                deleted = self.conn.execute("SELECT id, deadline FROM task_tombstones WHERE revision > ? LIMIT ?",
+                                            (self.revision, limit + 1)).fetchall()
+                if len(rows) + len(deleted) > limit:
+                    changes = [("reloaded", None, None)]
+                else:
+                    changes = [("updated", None, row) for row in rows] + \
+                              [("deleted", (task_id, None, None, None, None, None, deadline, None), None)
+                               for task_id, deadline in deleted]
+            self.revision = revision
+        except sqlite3.Error as e:
+            log(f"Не удалось проверить изменения: {e}", op="error")
+            return False
+        log("Изменения из другого процесса", op="poll", changes=len(changes), revision=revision)
+        self.notify(changes)
+        return True
 
-    def add_task(self, title, description, priority, status, deadline="", reminder=""):
+    def create_fts(self):
+        # Внешний FTS5-индекс по названию и описанию, синхронизируется триггерами
+        existed = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'tasks_fts'").fetchone()
+        try:
+            self.conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+                title, description, content='tasks', content_rowid='id', tokenize='unicode61')""")
+        except sqlite3.OperationalError:
+            self.fts = False  # SQLite собран без FTS5 - остаёмся на поиске подстроки
+            return
+        self.conn.executescript("""
+            CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks BEGIN
+                INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+            END;
+            CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks BEGIN
+                INSERT INTO tasks_fts(tasks_fts, rowid, title, description)
+                VALUES ('delete', old.id, old.title, old.description);
+            END;
+            CREATE TRIGGER IF NOT EXISTS tasks_fts_au AFTER UPDATE OF title, description ON tasks BEGIN
+                INSERT INTO tasks_fts(tasks_fts, rowid, title, description)
+                VALUES ('delete', old.id, old.title, old.description);
+                INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+            END;""")
+        if not existed:
+            self.conn.execute("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')")
+        self.fts = True
+
+    def create_stats(self):
+        # Счётчики total / status:<статус> / priority:<приоритет> ведутся триггерами,
+        # week:<понедельник> - сколько задач переведено в "Готово" за неделю
+        existed = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'task_stats'").fetchone()
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS task_stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TRIGGER IF NOT EXISTS task_stats_ai AFTER INSERT ON tasks BEGIN
+                INSERT INTO task_stats VALUES ('total', 1), ('status:' || COALESCE(new.status, ''), 1),
+                    ('priority:' || COALESCE(new.priority, ''), 1)
+                    ON CONFLICT(key) DO UPDATE SET value = value + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS task_stats_ad AFTER DELETE ON tasks BEGIN
+                UPDATE task_stats SET value = value - 1 WHERE key IN
+                    ('total', 'status:' || COALESCE(old.status, ''), 'priority:' || COALESCE(old.priority, ''));
+            END;
+            CREATE TRIGGER IF NOT EXISTS task_stats_au AFTER UPDATE OF status, priority ON tasks BEGIN
+                UPDATE task_stats SET value = value - 1 WHERE key IN
+                    ('status:' || COALESCE(old.status, ''), 'priority:' || COALESCE(old.priority, ''));
+                INSERT INTO task_stats VALUES ('status:' || COALESCE(new.status, ''), 1),
+                    ('priority:' || COALESCE(new.priority, ''), 1)
+                    ON CONFLICT(key) DO UPDATE SET value = value + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS task_stats_done AFTER UPDATE OF status ON tasks
+            WHEN new.status = 'Готово' AND old.status IS NOT 'Готово' BEGIN
+                INSERT INTO task_stats VALUES ('week:' || date('now', 'localtime', 'weekday 0', '-6 days'), 1)
+                    ON CONFLICT(key) DO UPDATE SET value = value + 1;
+            END;""")
+        if not existed:
+            # OR IGNORE: второй экземпляр, стартовавший одновременно, мог уже заполнить счётчики
+            self.conn.execute("""INSERT OR IGNORE INTO task_stats
+                SELECT 'total', COUNT(*) FROM tasks
+                UNION ALL SELECT 'status:' || COALESCE(status, ''), COUNT(*) FROM tasks GROUP BY 1
+                UNION ALL SELECT 'priority:' || COALESCE(priority, ''), COUNT(*) FROM tasks GROUP BY 1""")
+
+    @staticmethod
+    def fts_query(text):
+        # Каждое слово ищется по префиксу: "отч кв" -> "отч"* "кв"*
+        return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+    @profiled
+    def add_task(self, title, description, priority, status, deadline="", reminder="", recurrence=""):
         try:
+            started = time.perf_counter()
             created = datetime.datetime.now().strftime('%Y-%m-%d %H:%M')
-            self.conn.execute("INSERT INTO tasks VALUES (?,?,?,?,?,?,?,?)",
-                              (None, title, description, priority, status, created, deadline, reminder))
-            self.conn.commit()
-            log(f"Добавлена: {title}")
+            with self.transaction():
+                cur = self.conn.execute(self.INSERT_SQL, (title, description, priority, status, created, deadline,
+                                                          reminder))
+                if recurrence: self.save_recurrence(cur.lastrowid, recurrence)
+                self.pending_changes.append(("inserted", None, self.get_task(cur.lastrowid)))
+            log(f"Добавлена: {title}", op="add", task_id=cur.lastrowid, duration_ms=elapsed_ms(started))
             return True
         except sqlite3.Error as e:
-            QMessageBox.critical(None, "Ошибка", f"Не удалось добавить: {e}")
+            self.report_error("Ошибка", f"Не удалось добавить: {e}")
             return False
 
+    @profiled
     def get_tasks(self):
         try:
             cur = self.conn.cursor()
-            cur.execute("SELECT * FROM tasks")
+            cur.execute(f"SELECT {TASK_FIELDS} FROM tasks")
             return cur.fetchall()
         except sqlite3.Error as e:
-            QMessageBox.critical(None, "Ошибка", f"Не удалось загрузить: {e}")
+            self.report_error("Ошибка", f"Не удалось загрузить: {e}")
+            return []
+
+    def build_filter_query(self, search="", priority=None, status=None, deadline=None, ids=None,
+                           sort=None, after=None, archive=False):
+        # sort=(столбец таблицы, по убыванию) добавляет к строкам ключ сортировки и ORDER BY по нему;
+        # after - (ключ, id) последней строки предыдущей страницы; archive=True - UNION ALL с архивом
+        where, params = [], []
+        if ids is not None:
+            where.append(f"id IN ({','.join('?' * len(ids))})")
+            params += ids
+        if priority:
+            where.append("priority = ?")
+            params.append(priority)
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        today = day_number(datetime.date.today())
+        if deadline == "Просроченные":
+            where.append("deadline_day < ? AND status <> 'Готово'")
+            params.append(today)
+        elif deadline == "Сегодня":
+            where.append("deadline_day = ?")
+            params.append(today)
+        elif deadline == "На этой неделе":
+            where.append("deadline_day BETWEEN ? AND ?")
+            params += [today, today + 7]
+        if deadline in ("Сегодня", "На этой неделе"):
+            # Повторяющаяся задача попадает сюда и по развёрнутым на этот отрезок повторениям
+            series = self.recurring_ids(today, today + 7 if deadline == "На этой неделе" else today)
+            if series:
+                where[-1] = f"({where[-1]} OR id IN ({','.join('?' * len(series))}))"
+                params += series
+        match = self.fts_query(search) if self.fts and search else ""
+        key = None if sort is None else "fts.rank" if sort[0] < 0 and match else SORT_KEYS[max(sort[0], 0)]
+
+        def select(table, key, match):
+            sql = f"SELECT {TASK_FIELDS}{f', {key}' if key else ''} FROM {table}"
+            branch_where, branch_params = [*where], [*params]
+            if match:
+                sql += " JOIN (SELECT rowid, rank FROM tasks_fts WHERE tasks_fts MATCH ?) AS fts ON fts.rowid = id"
+                branch_params.insert(0, match)
+            elif search:
+                branch_where.append("(instr(py_lower(title), ?) > 0 OR instr(py_lower(description), ?) > 0)")
+                branch_params += [search.lower()] * 2
+            if key and after is not None:
+                # Keyset: страница начинается строго после последней строки, без OFFSET и пропуска строк;
+                # отдельное сравнение ключа нужно, чтобы SQLite искал по индексу-выражению, а не сканировал его
+                op = "<" if sort[1] else ">"
+                branch_where.append(f"{key} {op}= ? AND ({key}, id) {op} (?, ?)")
+                branch_params += [after[0], *after]
+            if branch_where: sql += " WHERE " + " AND ".join(branch_where)
+            return sql, branch_params
+
+        direction = " DESC" if sort and sort[1] else ""
+        sql, query_params = select("tasks", key, match)
+        if not archive:
+            if key:
+                sql += f" ORDER BY {key}{direction}, id{direction}"
+            elif match:
+                sql += " ORDER BY fts.rank"
+            return sql, query_params
+        # В архиве нет FTS: поиск там - подстрокой, а при сортировке по релевантности архив идёт после найденного
+        archived_sql, archived_params = select("archive.tasks", "0" if key == "fts.rank" else key, "")
+        if match and not key: sql = f"SELECT * FROM ({sql} ORDER BY fts.rank)"
+        sql = f"{sql} UNION ALL {archived_sql}"
+        if key:
+            # У составного запроса ORDER BY - по номерам столбцов результата: ключ идёт после полей задачи
+            sql += f" ORDER BY {len(TASK_FIELDS.split(', ')) + 1}{direction}, 1{direction}"
+        return sql, query_params + archived_params
+
+    @profiled
+    def filter_tasks(self, search="", priority=None, status=None, deadline=None, limit=None):
+        try:
+            sql, params = self.build_filter_query(search, priority, status, deadline)
+            if limit is not None:
+                sql, params = sql + " LIMIT ?", [*params, limit]
+            return self.conn.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            self.report_error("Ошибка", f"Не удалось загрузить: {e}")
+            return []
+
+    @profiled
+    def fetch_page(self, filters, sort_column=-1, descending=False, after=None, limit=PAGE_SIZE, archive=False):
+        # Страница задач и (ключ, id) её последней строки для следующей; None - дальше строк нет
+        try:
+            sql, params = self.build_filter_query(**filters, sort=(sort_column, descending), after=after,
+                                                  archive=archive)
+            rows = self.conn.execute(sql + " LIMIT ?", [*params, limit]).fetchall()
+        except sqlite3.Error as e:
+            self.report_error("Ошибка", f"Не удалось загрузить: {e}")
+            return [], None
+        last = (rows[-1][-1], rows[-1][0]) if len(rows) == limit else None
+        return [row[:-1] for row in rows], last
+
+    @profiled
+    def count_filtered(self, search="", priority=None, status=None, deadline=None, archive=False):
+        if not (search or priority or status or deadline):
+            return self.count_tasks() + (self.count_archived() if archive else 0)
+        try:
+            sql, params = self.build_filter_query(search, priority, status, deadline, archive=archive)
+            return self.conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    @profiled
+    def filter_ids(self, ids, search="", priority=None, status=None, deadline=None):
+        # Какие из перечисленных задач проходят текущий фильтр - поиск по первичному ключу
+        if not ids: return set()
+        try:
+            sql, params = self.build_filter_query(search, priority, status, deadline, ids=list(ids))
+            return {row[0] for row in self.conn.execute(sql, params)}
+        except sqlite3.Error:
+            return set()
+
+    @profiled
+    def count_tasks(self):
+        try:
+            row = self.conn.execute("SELECT value FROM task_stats WHERE key = 'total'").fetchone()
+            return row[0] if row else 0
+        except sqlite3.Error:
+            return 0
+
+    @profiled
+    def count_archived(self):
+        try:
+            return self.conn.execute("SELECT COUNT(*) FROM archive.tasks").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def delta_revision(self):
+        # Ревизия последней выгруженной дельты - since по умолчанию для следующей
+        try:
+            row = self.conn.execute("SELECT value FROM task_stats WHERE key = 'delta:exported'").fetchone()
+        except sqlite3.Error:
+            row = None
+        return row[0] if row else 0
+
+    @profiled
+    def count_overdue(self):
+        try:
+            return self.conn.execute("""SELECT COUNT(*) FROM tasks INDEXED BY idx_tasks_open_deadline_day
+                WHERE status <> 'Готово' AND deadline_day < ?""", (day_number(datetime.date.today()),)).fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    @profiled
+    def get_stats(self):
+        try:
+            counters = dict(self.conn.execute("SELECT key, value FROM task_stats WHERE key NOT LIKE 'week:%'"))
+        except sqlite3.Error:
+            counters = {}
+        total, done = counters.get("total", 0), counters.get("status:Готово", 0)
+        return {"total": total, "done": done, "pending": total - done, "overdue": self.count_overdue(),
+                "priorities": {p: counters.get(f"priority:{p}", 0) for p in ("Высокий", "Средний", "Низкий")}}
+
+    @profiled
+    def get_weekly_throughput(self, weeks=8):
+        # [(понедельник недели, сколько задач выполнено)], старые недели первыми
+        monday = datetime.date.today() - datetime.timedelta(days=datetime.date.today().weekday())
+        starts = [(monday - datetime.timedelta(weeks=i)).isoformat() for i in range(weeks - 1, -1, -1)]
+        try:
+            done = dict(self.conn.execute("SELECT substr(key, 6), value FROM task_stats WHERE key >= ? AND key <= ?",
+                                          (f"week:{starts[0]}", f"week:{starts[-1]}")))
+        except sqlite3.Error:
+            done = {}
+        return [(start, done.get(start, 0)) for start in starts]
+
+    @profiled
+    def get_task(self, task_id):
+        try:
+            return self.conn.execute(self.GET_SQL, (task_id,)).fetchone()
+        except sqlite3.Error:
+            return None
+
+    @profiled
+    def get_reminders(self):
+        try:
+            return self.conn.execute("SELECT id, reminder_ts FROM tasks WHERE reminder_ts IS NOT NULL").fetchall()
+        except sqlite3.Error:
             return []
 
+    @profiled
+    def get_tasks_by_ids(self, ids):
+        rows = []
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows += self.conn.execute(f"SELECT {TASK_FIELDS} FROM tasks WHERE id IN ({','.join('?' * len(chunk))})",
+                                      chunk).fetchall()
+        return rows
+
+    @profiled
+    def bulk(self, action, params=(), ids=None, filters=None, condition=""):
+        # Групповая операция одним запросом в одной транзакции: по списку id - через executemany,
+        # по фильтру (filters - как у filter_tasks) - одним UPDATE/DELETE с подзапросом
+        try:
+            started = time.perf_counter()
+            with self.transaction():
+                if filters is not None:
+                    sql, filter_params = self.build_filter_query(**filters)
+                    cur = self.conn.execute(f"{action} WHERE id IN (SELECT id FROM ({sql})){condition}",
+                                            [*params, *filter_params])
+                    self.pending_changes.append(("reloaded", None, None))
+                else:
+                    ids = list(ids)
+                    old = self.get_tasks_by_ids(ids)
+                    cur = self.conn.executemany(f"{action} WHERE id = ?{condition}",
+                                                [(*params, task_id) for task_id in ids])
+                    new = {task[0]: task for task in self.get_tasks_by_ids(ids)}
+                    self.pending_changes += [("deleted", task, None) if task[0] not in new else
+                                             ("updated", task, new[task[0]]) for task in old if new.get(task[0]) != task]
+            log(action.split(" SET")[0], op="bulk", rows=cur.rowcount, duration_ms=elapsed_ms(started))
+            return cur.rowcount
+        except sqlite3.Error as e:
+            self.report_error("Ошибка", f"Не удалось выполнить групповую операцию: {e}")
+            return 0
+
+    def delete_tasks(self, ids=None, filters=None):
+        return self.bulk("DELETE FROM tasks", ids=ids, filters=filters)
+
+    def set_status(self, status, ids=None, filters=None):
+        return self.bulk("UPDATE tasks SET status = ?", (status,), ids, filters)
+
+    def set_priority(self, priority, ids=None, filters=None):
+        return self.bulk("UPDATE tasks SET priority = ?", (priority,), ids, filters)
+
+    def shift_deadlines(self, days, ids=None, filters=None):
+        return self.bulk("UPDATE tasks SET deadline = date(deadline, ?)", (f"{days:+d} days",), ids, filters,
+                         condition=" AND deadline > ''")
+
+    def clear_reminders(self, ids=None, filters=None):
+        return self.bulk("UPDATE tasks SET reminder = ''", (), ids, filters, condition=" AND reminder > ''")
+
+    @profiled
+    def archive_done(self, days=ARCHIVE_DAYS, batch_size=ARCHIVE_BATCH):
+        # Выполненные задачи старше days дней (по дедлайну, без него - по созданию) переезжают в архив
+        # пачками: короткие транзакции не держат запись надолго. В WAL коммит двух файлов не атомарен,
+        # поэтому пачка сначала копируется в архив и только потом удаляется из tasks: сбой между ними
+        # оставит дубль, который следующий перенос перезапишет и удалит; чужую задачу с тем же id (другой uuid)
+        # перенос не затирает - строка остаётся в tasks. Повторяющиеся задачи остаются:
+        # удаление из tasks стёрло бы их правило и исключения, и из архива серия вернулась бы без них
+        started, moved, last_id = time.perf_counter(), 0, 0
+        cutoff = day_number(datetime.date.today()) - days
+        try:
+            while True:
+                ids = [row[0] for row in self.conn.execute(
+                    """SELECT id FROM tasks INDEXED BY idx_tasks_status WHERE status = 'Готово' AND id > ?
+                       AND IFNULL(deadline_day, created_ts / 86400) < ?
+                       AND id NOT IN (SELECT task_id FROM task_recurrence)
+                       AND NOT EXISTS (SELECT 1 FROM archive.tasks AS a
+                                       WHERE a.id = tasks.id AND a.uuid IS NOT tasks.uuid)
+                       ORDER BY id LIMIT ?""",
+                    (last_id, cutoff, batch_size))]
+                if not ids: break
+                marks = ','.join('?' * len(ids))
+                with self.transaction():
+                    self.conn.execute(f"""INSERT OR REPLACE INTO archive.tasks ({ARCHIVE_FIELDS}, archived)
+                        SELECT {ARCHIVE_FIELDS}, datetime('now', 'localtime') FROM tasks WHERE id IN ({marks})""", ids)
+                with self.transaction():
+                    self.conn.execute(f"DELETE FROM tasks WHERE id IN ({marks})", ids)
+                moved, last_id = moved + len(ids), ids[-1]
+        except sqlite3.Error as e:
+            self.report_error("Ошибка", f"Не удалось перенести в архив: {e}")
+        if moved:
+            log("Перенос в архив", op="archive", rows=moved, days=days, duration_ms=elapsed_ms(started))
+            self.notify([("reloaded", None, None)])
+        return moved
+
+    @profiled
+    def unarchive(self, ids):
+        # Возврат из архива с прежними id; вставка в tasks проходит все триггеры (FTS, счётчики, ревизии).
+        # Порядок обратный переносу: сначала вставка, потом удаление из архива. Задача, чей id или uuid
+        # уже занят в tasks, остаётся в архиве - о ней сообщается, а не затирается
+        ids, restored, conflicts = list(ids), 0, []
+        try:
+            started = time.perf_counter()
+            for i in range(0, len(ids), ARCHIVE_BATCH):
+                chunk = ids[i:i + ARCHIVE_BATCH]
+                marks = ','.join('?' * len(chunk))
+                rows = self.conn.execute(f"""SELECT a.id, EXISTS (SELECT 1 FROM tasks WHERE id = a.id OR uuid = a.uuid)
+                    FROM archive.tasks AS a WHERE a.id IN ({marks})""", chunk).fetchall()
+                conflicts += [task_id for task_id, taken in rows if taken]
+                chunk = [task_id for task_id, taken in rows if not taken]
+                if not chunk: continue
+                marks = ','.join('?' * len(chunk))
+                with self.transaction():
+                    self.conn.execute(f"""INSERT INTO tasks ({TASK_FIELDS}, uuid)
+                        SELECT {TASK_FIELDS}, uuid FROM archive.tasks WHERE id IN ({marks})""", chunk)
+                    self.pending_changes += [("inserted", None, task) for task in self.get_tasks_by_ids(chunk)]
+                with self.transaction():
+                    self.conn.execute(f"DELETE FROM archive.tasks WHERE id IN ({marks})", chunk)
+                restored += len(chunk)
+            log("Возврат из архива", op="unarchive", rows=restored, conflicts=len(conflicts),
+                duration_ms=elapsed_ms(started))
+            if conflicts:
+                self.report_error("Архив", "Не возвращены из архива - id или uuid уже заняты задачами: "
+                                  + ", ".join(map(str, conflicts[:20])) + (" ..." if len(conflicts) > 20 else ""))
+            return restored
+        except sqlite3.Error as e:
+            self.report_error("Ошибка", f"Не удалось вернуть из архива: {e}")
+            return restored
+
+    def notify(self, changes):
+        for listener in self.change_listeners:
+            listener(changes)
+
+    @profiled
+    def build_index(self):
+        index = TaskIndex(fts=self.fts)
+        try:
+            index.build(self.conn.execute("SELECT id, title, description, priority, status, deadline_day FROM tasks"))
+            index.recurring = self.get_recurrences()
+        except sqlite3.Error as e:
+            # Индекс необязателен: без него окно считает фильтр запросами
+            log(f"Не удалось построить индекс: {e}", op="error")
+            return None
+        return index
+
+    @profiled
+    def get_day_counts(self, start=None, end=None, dates=None):
+        # Агрегат по дням для календаря: (дата, готово, просрочено, в процессе), с повторениями серий
+        today = day_number(datetime.date.today())
+        sql = """SELECT date(deadline_day * 86400, 'unixepoch'), SUM(status = 'Готово'),
+                        SUM(status <> 'Готово' AND deadline_day < ?), SUM(status <> 'Готово' AND deadline_day >= ?)
+                 FROM tasks WHERE """
+        if dates is not None:
+            days = [day_number(datetime.date.fromisoformat(d)) for d in dates]
+            first, last = min(days), max(days)
+            sql += f"deadline_day IN ({','.join('?' * len(dates))})"
+            params = [today, today, *days]
+        else:
+            first, last = (day_number(datetime.date.fromisoformat(d)) for d in (start, end))
+            sql += "deadline_day BETWEEN ? AND ?"
+            params = [today, today, first, last]
+        try:
+            rows = self.conn.execute(sql + " GROUP BY deadline_day", params).fetchall()
+        except sqlite3.Error:
+            return []
+        extra = self.expand_occurrences(first, last)
+        if not extra: return rows
+        counts = {row[0]: list(row[1:]) for row in rows}
+        for day, task in extra:
+            if dates is not None and task[6] not in dates: continue
+            counts.setdefault(task[6], [0, 0, 0])[0 if task[4] == "Готово" else 1 if day < today else 2] += 1
+        return [(date, *day_counts) for date, day_counts in counts.items()]
+
+    @profiled
     def get_tasks_by_date(self, date):
         try:
             cur = self.conn.cursor()
-            cur.execute("SELECT * FROM tasks WHERE deadline = ?", (date,))
-            return cur.fetchall()
+            cur.execute(f"SELECT {TASK_FIELDS} FROM tasks WHERE deadline = ?", (date,))
+            rows = cur.fetchall()
         except sqlite3.Error:
             return []
+        day = day_number(datetime.date.fromisoformat(date))
+        return rows + [task for _, task in self.expand_occurrences(day, day)]
 
-    def update_task(self, task_id, title, description, priority, status, deadline="", reminder=""):
+    @profiled
+    def get_recurrences(self):
+        # {id задачи: (правило, первый день серии)}; повторяющихся задач немного, таблица читается целиком
         try:
-            self.conn.execute("""UPDATE tasks SET title=?, description=?, priority=?, 
-                status=?, deadline=?, reminder=? WHERE id=?""",
-                              (title, description, priority, status, deadline, reminder, task_id))
-            self.conn.commit()
-            log(f"Изменена ID {task_id}")
+            rows = self.conn.execute("SELECT task_id, rule, start_day FROM task_recurrence").fetchall()
+        except sqlite3.Error:
+            return {}
+        return {row[0]: row[1:] for row in rows}
+
+    def get_recurrence(self, task_id):
+        try:
+            return self.conn.execute("SELECT rule, start_day FROM task_recurrence WHERE task_id = ?",
+                                     (task_id,)).fetchone()
+        except sqlite3.Error:
+            return None
+
+    def save_recurrence(self, task_id, rule):
+        # Вызывается внутри транзакции правки. Первый день серии - дедлайн; прежний остаётся, пока дедлайн
+        # на сетке того же правила (ежемесячная серия с 31-го не съезжает на 30-е). Без дедлайна повторять нечего
+        row = self.conn.execute("SELECT deadline_day FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        day = row[0] if row else None
+        if not rule or day is None:
+            self.conn.execute("DELETE FROM task_recurrence WHERE task_id = ?", (task_id,))
+            self.conn.execute("DELETE FROM task_occurrences WHERE task_id = ?", (task_id,))
+            return
+        old = self.get_recurrence(task_id)
+        start = old[1] if old and old[0] == rule and occurrences(rule, old[1], day, day) else day
+        self.conn.execute("INSERT OR REPLACE INTO task_recurrence VALUES (?, ?, ?)", (task_id, rule, start))
+
+    def recurring_ids(self, first, last):
+        # Незакрытые серии с повторением в отрезке [first, last]; повторения до дедлайна строки уже выполнены
+        try:
+            rows = self.conn.execute("""SELECT task_id, rule, start_day, deadline_day FROM task_recurrence
+                JOIN tasks ON id = task_id WHERE status <> 'Готово' AND deadline_day <= ?""", (last,)).fetchall()
+        except sqlite3.Error:
+            return []
+        return [task_id for task_id, rule, start, day in rows if occurrences(rule, start, max(first, day), last)]
+
+    @profiled
+    def expand_occurrences(self, first, last):
+        # Повторения в отрезке [first, last] сверх самих строк задач: после дедлайна строки серия открыта,
+        # выполненные дни - из task_occurrences. [(день, строка задачи с датой и статусом повторения)]
+        try:
+            series = self.conn.execute(f"""SELECT {TASK_FIELDS}, deadline_day, rule, start_day
+                FROM task_recurrence JOIN tasks ON id = task_id""").fetchall()
+            done = self.conn.execute("SELECT task_id, day FROM task_occurrences WHERE day BETWEEN ? AND ?",
+                                     (first, last)).fetchall()
+        except sqlite3.Error:
+            return []
+        done_days, found = collections.defaultdict(set), []
+        for task_id, day in done:
+            done_days[task_id].add(day)
+        for row in series:
+            task, deadline_day, rule, start = row[:8], row[8], row[9], row[10]
+            days = {day: "Готово" for day in done_days[task[0]] if day != deadline_day}
+            if deadline_day is not None and task[4] != "Готово":
+                for day in occurrences(rule, start, max(first, deadline_day + 1), last):
+                    days.setdefault(day, "В процессе")
+            found += [(day, (*task[:4], status, task[5], day_date(day).isoformat(), task[7]))
+                      for day, status in sorted(days.items())]
+        return found
+
+    @profiled
+    def complete_occurrence(self, task_id, day=None):
+        # Выполнено одно повторение (по умолчанию ближайшее - дедлайн строки): день ложится исключением
+        # в task_occurrences, а дедлайн и напоминание строки переходят на следующее невыполненное повторение
+        try:
+            started = time.perf_counter()
+            with self.transaction():
+                old, recurrence = self.get_task(task_id), self.get_recurrence(task_id)
+                current = self.conn.execute("SELECT deadline_day FROM tasks WHERE id = ?", (task_id,)).fetchone()
+                if not old or not recurrence or current[0] is None: return False
+                day = current[0] if day is None else day
+                self.conn.execute("INSERT OR IGNORE INTO task_occurrences VALUES (?, ?)", (task_id, day))
+                shift = 0
+                if day == current[0]:
+                    done = {row[0] for row in self.conn.execute(
+                        "SELECT day FROM task_occurrences WHERE task_id = ? AND day > ?", (task_id, day))}
+                    following = next_occurrence(*recurrence, day, done)
+                    if following is not None: shift = following - day
+                # UPDATE и при нулевом сдвиге: триггер даёт строке новую ревизию, другие процессы увидят правку
+                self.conn.execute("""UPDATE tasks SET deadline = date(deadline, ?), reminder = CASE WHEN reminder > ''
+                    THEN strftime('%Y-%m-%d %H:%M', reminder, ?) ELSE reminder END WHERE id = ?""",
+                                  (f"{shift:+d} days", f"{shift:+d} days", task_id))
+                self.pending_changes.append(("updated", old, self.get_task(task_id)))
+            log(f"Выполнено повторение ID {task_id}", op="occurrence", task_id=task_id, day=day_date(day).isoformat(),
+                duration_ms=elapsed_ms(started))
+            return True
+        except sqlite3.Error as e:
+            self.report_error("Ошибка", f"Не удалось отметить повторение: {e}")
+            return False
+
+    @profiled
+    def next_reminder(self, task_id, after, days=RECURRENCE_HORIZON_DAYS):
+        # Напоминание серии приходит к каждому повторению: время строки сдвигается на повторения после
+        # её дедлайна, разворачиваются только ближайшие days дней. Первое позже after (unix-время) или None
+        try:
+            row = self.conn.execute("""SELECT reminder, deadline_day, rule, start_day FROM tasks
+                JOIN task_recurrence ON task_id = id
+                WHERE id = ? AND reminder > '' AND deadline_day IS NOT NULL AND status <> 'Готово'""",
+                                    (task_id,)).fetchone()
+            if not row: return None
+            reminder, deadline_day, rule, start = row
+            done = {row[0] for row in self.conn.execute(
+                "SELECT day FROM task_occurrences WHERE task_id = ? AND day > ?", (task_id, deadline_day))}
+            base = datetime.datetime.strptime(reminder, '%Y-%m-%d %H:%M')
+        except (sqlite3.Error, ValueError):
+            return None
+        today = day_number(datetime.date.fromtimestamp(after))
+        for day in occurrences(rule, start, deadline_day + 1, today + days):
+            when = (base + datetime.timedelta(days=day - deadline_day)).timestamp()
+            if day not in done and when > after: return int(when)
+        return None
+
+    @profiled
+    def update_task(self, task_id, title, description, priority, status, deadline="", reminder="", recurrence=None):
+        # recurrence=None оставляет правило повторения как есть, "" - убирает его
+        try:
+            started = time.perf_counter()
+            with self.transaction():
+                old = self.get_task(task_id)
+                self.conn.execute(self.UPDATE_SQL, (title, description, priority, status, deadline, reminder, task_id))
+                if recurrence is not None: self.save_recurrence(task_id, recurrence)
+                if old: self.pending_changes.append(("updated", old, self.get_task(task_id)))
+            log(f"Изменена ID {task_id}", op="update", task_id=task_id, duration_ms=elapsed_ms(started))
             return True
         except sqlite3.Error as e:
-            QMessageBox.critical(None, "Ошибка", f"Не удалось обновить: {e}")
+            self.report_error("Ошибка", f"Не удалось обновить: {e}")
             return False
 
+    @profiled
     def delete_task(self, task_id):
         try:
-            self.conn.execute("DELETE FROM tasks WHERE id=?", (task_id,))
-            self.conn.commit()
-            log(f"Удалена ID {task_id}")
+            started = time.perf_counter()
+            with self.transaction():
+                old = self.get_task(task_id)
+                self.conn.execute(self.DELETE_SQL, (task_id,))
+                if old: self.pending_changes.append(("deleted", old, None))
+            log(f"Удалена ID {task_id}", op="delete", task_id=task_id, duration_ms=elapsed_ms(started))
             return True
         except sqlite3.Error as e:
-            QMessageBox.critical(None, "Ошибка", f"Не удалось удалить: {e}")
+            self.report_error("Ошибка", f"Не удалось удалить: {e}")
+            return False
+
+
+class TaskIndex:
+    # Колоночный индекс задач в памяти для подсчёта и проверки фильтра без SQL: каждому значению
+    # приоритета, статуса и дня дедлайна соответствует битовая маска (int, бит на позицию задачи),
+    # фильтр - AND/OR масок целиком, без цикла по строкам. Текст хранится в нижнем регистре
+    def __init__(self, fts=True):
+        self.fts = fts  # поиск как у TaskDB: по префиксам слов (FTS5) или подстрокой
+        self.ids, self.positions, self.texts, self.values = [], {}, [], []
+        self.priority, self.status, self.days, self.alive = {}, {}, {}, 0
+        # Кэши: маска просроченных на сегодня и маски последних поисков {текст: [проверка, маска]},
+        # поисковые маски правятся вместе с задачами
+        self.overdue, self.searches = None, {}
+        # Правила повторения {id: (правило, первый день)} из TaskDB.get_recurrences - их обновляет владелец
+        self.recurring = {}
+
+    @staticmethod
+    def bitmap(positions, size):
+        bits = bytearray(size // 8 + 1)
+        for pos in positions:
+            bits[pos >> 3] |= 1 << (pos & 7)
+        return int.from_bytes(bits, "little")
+
+    @staticmethod
+    def deadline_day(deadline):
+        try:
+            return day_number(datetime.datetime.fromisoformat(deadline).date())
+        except (TypeError, ValueError):
+            return None
+
+    def build(self, rows):
+        # rows - (id, название, описание, приоритет, статус, deadline_day) из TaskDB.build_index
+        groups = {"priority": {}, "status": {}, "days": {}}
+        for pos, (task_id, title, description, priority, status, day) in enumerate(rows):
+            self.ids.append(task_id)
+            self.texts.append(f"{title}\n{description or ''}".lower())
+            self.values.append((priority, status, day))
+            groups["priority"].setdefault(priority, []).append(pos)
+            groups["status"].setdefault(status, []).append(pos)
+            if day is not None: groups["days"].setdefault(day, []).append(pos)
+        size = len(self.ids)
+        self.positions = {task_id: pos for pos, task_id in enumerate(self.ids)}
+        for name, group in groups.items():
+            setattr(self, name, {value: self.bitmap(positions, size) for value, positions in group.items()})
+        self.alive = (1 << size) - 1
+
+    def apply(self, changes):
+        # Правки из TaskDB.change_listeners; "reloaded" индекс не применяет - его перестраивают
+        for kind, old, new in changes:
+            if new is not None:
+                self.put(new)
+            elif old is not None:
+                self.remove(old[0])
+
+    def set_bits(self, pos, values, on):
+        bit = 1 << pos
+        for masks, value in zip((self.priority, self.status, self.days), values):
+            if masks is self.days and value is None: continue
+            masks[value] = masks.get(value, 0) | bit if on else masks.get(value, 0) & ~bit
+        self.alive = self.alive | bit if on else self.alive & ~bit
+        self.overdue = None
+
+    def put(self, task):
+        pos = self.positions.get(task[0])
+        if pos is None:
+            pos = self.positions[task[0]] = len(self.ids)
+            self.ids.append(task[0])
+            self.texts.append("")
+            self.values.append((None, None, None))
+        else:
+            self.set_bits(pos, self.values[pos], False)
+        self.texts[pos] = f"{task[1]}\n{task[2] or ''}".lower()
+        self.values[pos] = (task[3], task[4], self.deadline_day(task[6]))
+        self.set_bits(pos, self.values[pos], True)
+        for entry in self.searches.values():
+            found = all(check(self.texts[pos]) for check in entry[0])
+            entry[1] = entry[1] | 1 << pos if found else entry[1] & ~(1 << pos)
+
+    def remove(self, task_id):
+        pos = self.positions.pop(task_id, None)
+        if pos is None: return
+        self.set_bits(pos, self.values[pos], False)
+        self.texts[pos], self.values[pos] = "", (None, None, None)
+
+    def deadline_mask(self, deadline):
+        today = day_number(datetime.date.today())
+        if deadline == "Сегодня":
+            return self.days.get(today, 0) | self.recurring_mask(today, today)
+        if deadline == "На этой неделе":
+            mask = self.recurring_mask(today, today + 7)
+            for day in range(today, today + 8):
+                mask |= self.days.get(day, 0)
+            return mask
+        if deadline == "Просроченные":
+            if self.overdue is None or self.overdue[0] != today:
+                mask = 0
+                for day, day_mask in self.days.items():
+                    if day < today: mask |= day_mask
+                self.overdue = (today, mask)
+            return self.overdue[1] & ~self.status.get("Готово", 0)
+        return -1
+
+    def recurring_mask(self, first, last):
+        # Как TaskDB.recurring_ids: незакрытые серии с повторением в отрезке, считая от дедлайна строки
+        mask = 0
+        for task_id, (rule, start) in self.recurring.items():
+            pos = self.positions.get(task_id)
+            if pos is None: continue
+            _, status, day = self.values[pos]
+            if status != "Готово" and day is not None and occurrences(rule, start, max(first, day), last):
+                mask |= 1 << pos
+        return mask
+
+    def word_checks(self, text):
+        # Проверки по одной на слово запроса; сначала быстрый поиск подстроки, регулярное выражение -
+        # только если слово не нашлось в начале текста или после пробела/перевода строки
+        if not self.fts:
+            needle = text.lower()
+            return [lambda row_text: needle in row_text]
+        checks = []
+        for word in re.findall(r"\w+", text.lower()):
+            prefix = re.compile(rf"(?<!\w){re.escape(word)}").search
+            checks.append(lambda row_text, word=word, prefix=prefix: word in row_text and (
+                row_text.startswith(word) or f" {word}" in row_text or f"\n{word}" in row_text or
+                prefix(row_text) is not None))
+        return checks
+
+    def search_mask(self, text):
+        entry = self.searches.get(text)
+        if entry is None:
+            # Поиск - единственный фильтр с проходом по строкам; повтор того же запроса берёт маску из кэша
+            checks, positions = self.word_checks(text), range(len(self.texts))
+            for check in checks:
+                positions = [pos for pos in positions if check(self.texts[pos])]
+            entry = [checks, self.bitmap(positions, len(self.ids))]
+            if len(self.searches) >= 8: self.searches.clear()
+            self.searches[text] = entry
+        return entry[1]
+
+    def mask(self, search="", priority=None, status=None, deadline=None):
+        mask = self.alive
+        if priority: mask &= self.priority.get(priority, 0)
+        if status: mask &= self.status.get(status, 0)
+        if deadline: mask &= self.deadline_mask(deadline)
+        if search and mask: mask &= self.search_mask(search)
+        return mask
+
+    def count(self, **filters):
+        return self.mask(**filters).bit_count()
+
+    def matching(self, ids, search="", **filters):
+        # То же, что TaskDB.filter_ids: какие из перечисленных задач проходят фильтр. Поиск проверяется
+        # только у этих строк - маска поиска прошла бы по всем
+        bits = self.mask(**filters).to_bytes(len(self.ids) // 8 + 1, "little")
+        checks = self.word_checks(search) if search else ()
+        return {task_id for task_id in ids
+                if (pos := self.positions.get(task_id)) is not None and bits[pos >> 3] >> (pos & 7) & 1
+                and all(check(self.texts[pos]) for check in checks)}
+
+
+class DbWorker(QObject):
+    finished = pyqtSignal(int, object, str)  # id запроса, результат, ошибка
+
+    def __init__(self, path=DB_NAME, cancelled=None):
+        super().__init__()
+        self.path, self.db, self.errors = path, None, []
+        # cancelled - общий с AsyncDB набор отменённых запросов; current - выполняемый сейчас
+        self.cancelled, self.current, self.lock = set() if cancelled is None else cancelled, None, threading.Lock()
+
+    @pyqtSlot(int, str, object, object)
+    def run_request(self, request_id, method, args, kwargs):
+        if request_id in self.cancelled:
+            self.finished.emit(request_id, None, "")
+            return
+        # Своя TaskDB создаётся уже в рабочем потоке: соединение sqlite3 привязано к потоку
+        if self.db is None:
+            self.db = TaskDB(self.path, error_handler=lambda title, message: self.errors.append(message))
+        self.errors.clear()
+        with self.lock:
+            self.current = request_id
+        try:
+            result = getattr(self.db, method)(*args, **kwargs)
+        except sqlite3.Error as e:
+            result = None
+            self.errors.append(str(e))
+        except Exception as e:  # исключение из слота уронило бы поток, и ответов больше не было бы
+            result = None
+            self.errors.append(f"{type(e).__name__}: {e}")
+            log(f"Ошибка запроса {method}: {type(e).__name__}: {e}", op="error")
+        finally:
+            with self.lock:
+                self.current = None
+        self.finished.emit(request_id, result, "; ".join(self.errors))
+
+    def interrupt(self, request_id):
+        # Вызывается из потока GUI: Connection.interrupt потокобезопасен и обрывает идущий запрос,
+        # а под замком он не заденет следующий
+        with self.lock:
+            if self.current == request_id and self.db: self.db.conn.interrupt()
+
+    @pyqtSlot()
+    def close(self):
+        if self.db: self.db.close()
+
+
+class AsyncDB(QObject):
+    # Запросы к TaskDB выполняются в отдельном потоке, ответ приходит в callback в потоке GUI
+    requested = pyqtSignal(int, str, object, object)
+    busy_changed = pyqtSignal(bool)
+    error = pyqtSignal(str)
+
+    def __init__(self, path=DB_NAME, parent=None):
+        super().__init__(parent)
+        self.callbacks, self.next_id, self.cancelled = {}, 0, set()
+        self.thread = QThread(self)
+        self.worker = DbWorker(path, self.cancelled)
+        self.worker.moveToThread(self.thread)
+        self.requested.connect(self.worker.run_request)
+        self.worker.finished.connect(self.on_finished)
+        self.thread.start()
+
+    def call(self, method, *args, callback=None, **kwargs):
+        self.next_id += 1
+        self.callbacks[self.next_id] = callback
+        if len(self.callbacks) == 1: self.busy_changed.emit(True)
+        self.requested.emit(self.next_id, method, args, kwargs)
+        return self.next_id
+
+    def is_busy(self):
+        return bool(self.callbacks)
+
+    def cancel(self, request_ids):
+        # Ещё не начатые запросы рабочий поток пропустит, выполняющийся - прервёт; ответа не будет
+        for request_id in request_ids:
+            if request_id in self.callbacks and request_id not in self.cancelled:
+                self.cancelled.add(request_id)
+                self.worker.interrupt(request_id)
+                PROFILER.count("cancelled_requests")
+
+    def on_finished(self, request_id, result, error):
+        callback = self.callbacks.pop(request_id, None)
+        if not self.callbacks: self.busy_changed.emit(False)
+        if request_id in self.cancelled:
+            self.cancelled.discard(request_id)
+        elif error:
+            self.error.emit(error)
+        elif callback:
+            callback(result)
+
+    def close(self):
+        if not self.thread.isRunning(): return
+        QMetaObject.invokeMethod(self.worker, "close", Qt.ConnectionType.BlockingQueuedConnection)
+        self.thread.quit()
+        self.thread.wait()
+
+
+class TaskTableModel(QAbstractTableModel):
+    HEADERS = ["ID", "Название", "Описание", "Приоритет", "Статус", "Создано", "Дедлайн", "Напоминание"]
+    PRIORITY_COLORS = {"Высокий": QColor(255, 200, 200), "Средний": QColor(255, 255, 200)}
+    DONE_COLOR, OVERDUE_COLOR, SOON_COLOR = QColor(200, 255, 200), QColor(255, 150, 150), QColor(255, 200, 150)
+
+    MAX_PATCH = 200  # больше изменений за раз дешевле применить перезапросом
+    # Строки подгружаются страницами при прокрутке, сортирует SQL: модель хранит только загруженное
+    # и ключ последней строки (after); fetch_requested / sort_requested обрабатывает окно
+    fetch_requested, sort_requested = pyqtSignal(), pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tasks, self.rows, self.today = [], None, datetime.date.today()
+        self.sort_column, self.sort_order = -1, Qt.SortOrder.AscendingOrder
+        self.after, self.fetching = None, False
+
+    def set_tasks(self, tasks, after=None):
+        self.beginResetModel()
+        self.tasks, self.rows, self.today = list(tasks), None, datetime.date.today()
+        self.after, self.fetching = after, False
+        PROFILER.count("model_rows", len(self.tasks))
+        self.endResetModel()
+
+    def append_tasks(self, tasks, after):
+        self.fetching = False
+        if tasks:
+            self.beginInsertRows(QModelIndex(), len(self.tasks), len(self.tasks) + len(tasks) - 1)
+            self.tasks += tasks
+            self.rows = None
+            PROFILER.count("model_rows", len(tasks))
+            self.endInsertRows()
+        self.after = after
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.after is not None and not self.fetching
+
+    def fetchMore(self, parent=QModelIndex()):
+        self.fetching = True
+        self.fetch_requested.emit()
+
+    def task_at(self, row):
+        return self.tasks[row] if 0 <= row < len(self.tasks) else None
+
+    def row_of(self, task_id):
+        if self.rows is None:
+            self.rows = {task[0]: row for row, task in enumerate(self.tasks)}
+        return self.rows.get(task_id)
+
+    def apply_changes(self, changes, visible):
+        # visible - id изменённых задач, которые проходят текущий фильтр
+        for kind, old, new in changes:
+            row = self.row_of((new or old)[0])
+            keep = new is not None and new[0] in visible
+            if row is not None and keep and (self.sort_column < 0 or
+                                             self.sort_key(new) == self.sort_key(self.tasks[row])):
+                self.tasks[row] = new
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.HEADERS) - 1))
+                continue
+            if row is not None:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.tasks[row]
+                self.rows = None
+                self.endRemoveRows()
+            if keep:
+                row = self.insert_position(new)
+                if row is None: continue  # строка попадёт в одну из ещё не загруженных страниц
+                self.beginInsertRows(QModelIndex(), row, row)
+                self.tasks.insert(row, new)
+                self.rows = None
+                self.endInsertRows()
+
+    def insert_position(self, task):
+        if self.sort_order == Qt.SortOrder.AscendingOrder:
+            row = bisect.bisect_right(self.tasks, self.sort_key(task), key=self.sort_key)
+        else:
+            lo, hi, key = 0, len(self.tasks), self.sort_key(task)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.sort_key(self.tasks[mid]) >= key:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            row = lo
+        return None if row == len(self.tasks) and self.after is not None else row
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.tasks)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        task, col = self.tasks[index.row()], index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            return str(task[col])
+        if role == Qt.ItemDataRole.BackgroundRole:
+            return self.background(task, col)
+        return None
+
+    def background(self, task, col):
+        # Цвета считаются только для ячеек, которые реально отрисовываются
+        if col == 3:
+            return self.PRIORITY_COLORS.get(task[3], self.DONE_COLOR)
+        if col == 4 and task[4] == "Готово":
+            return self.DONE_COLOR
+        if col == 6 and task[6] and task[4] != "Готово":
+            try:
+                days = (datetime.date.fromisoformat(task[6]) - self.today).days
+            except ValueError:
+                return None
+            if days < 0: return self.OVERDUE_COLOR
+            if days <= 1: return self.SOON_COLOR
+        return None
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        if (column, order) == (self.sort_column, self.sort_order): return
+        self.sort_column, self.sort_order = column, order
+        self.sort_requested.emit()
+
+    def sort_args(self):
+        return self.sort_column, self.sort_order == Qt.SortOrder.DescendingOrder
+
+    def sort_key(self, task):
+        # Тот же порядок, что у SORT_KEYS в SQL: приоритет по рангу, пустые даты - в конце
+        column = self.sort_column
+        if column <= 0: return task[0], task[0]
+        value = task[column]
+        if column == 3:
+            return (PRIORITIES.index(value) if value in PRIORITIES else len(PRIORITIES)), task[0]
+        if column >= 5:
+            return ((0, value) if value else (1, "")), task[0]
+        return value or "", task[0]
+
+
+class ReminderScheduler(QObject):
+    due = pyqtSignal(list)
+    MAX_WAIT_MS = 60 * 60 * 1000  # раз в час перепроверяем очередь на случай перевода часов/сна
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db, self.heap, self.pending = db, [], {}
+        # Уже показанные напоминания: id -> (время, когда показано). Как shown_reminders до кучи - ключ (задача, время),
+        # чтобы перезагрузка или чужая правка не показала их снова; новое время напоминания сбрасывает ключ
+        self.fired = {}
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.fire_due)
+        db.change_listeners.append(self.on_tasks_changed)
+
+    @staticmethod
+    def parse(reminder):
+        # То же unix-время, что триггер кладёт в reminder_ts
+        try:
+            return int(time.mktime(time.strptime(reminder, '%Y-%m-%d %H:%M')))
+        except (TypeError, ValueError, OverflowError):
+            return None
+
+    def unfired(self, task_id, when):
+        # Время, к которому ставить напоминание: показанное не повторяется, у серии вместо него - следующее
+        # после последнего показанного (время строки серии - первое повторение, оно может быть и раньше)
+        fired, shown_at = self.fired.get(task_id, (None, None))
+        if when is not None and fired is not None and when <= fired:
+            following = self.db.next_reminder(task_id, shown_at)  # как в fire_due
+            if when == fired or following is not None: return following
+        self.fired.pop(task_id, None)
+        return when
+
+    def load(self):
+        reminders = dict(self.db.get_reminders())
+        self.fired = {task_id: when for task_id, when in self.fired.items() if task_id in reminders}
+        self.pending = {task_id: when for task_id, when in
+                        ((task_id, self.unfired(task_id, when)) for task_id, when in reminders.items())
+                        if when is not None}
+        self.heap = [(when, task_id) for task_id, when in self.pending.items()]
+        heapq.heapify(self.heap)
+        self.arm()
+
+    def on_tasks_changed(self, changes):
+        if any(kind == "reloaded" for kind, _, _ in changes):
+            self.load()
+            return
+        for kind, old, new in changes:
+            if not old or not new or old[7] != new[7]:
+                self.reschedule((new or old)[0], new[7] if new else "")
+
+    def reschedule(self, task_id, reminder):
+        when = self.unfired(task_id, self.parse(reminder) if reminder else None)
+        if when is None:
+            self.pending.pop(task_id, None)
+        elif self.pending.get(task_id) != when:
+            self.pending[task_id] = when
+            heapq.heappush(self.heap, (when, task_id))
+        if len(self.heap) > 2 * len(self.pending) + 64:
+            self.heap = [(when, task_id) for task_id, when in self.pending.items()]
+            heapq.heapify(self.heap)
+        self.arm()
+
+    def peek(self):
+        # Записи, чьё время уже изменили или удалили, выбрасываются лениво
+        while self.heap and self.pending.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def arm(self):
+        when = self.peek()
+        if when is None:
+            self.timer.stop()
+            return
+        wait = (when - time.time()) * 1000
+        self.timer.start(int(min(max(wait, 0), self.MAX_WAIT_MS)))
+
+    def fire_due(self):
+        now, due = time.time(), []
+        while (when := self.peek()) is not None and when <= now:
+            task_id = heapq.heappop(self.heap)[1]
+            del self.pending[task_id]
+            self.fired[task_id] = when, now
+            due.append(task_id)
+        for task_id in due:
+            # У повторяющейся задачи следующее напоминание - к следующему повторению в пределах горизонта
+            when = self.db.next_reminder(task_id, now)
+            if when is not None:
+                self.pending[task_id] = when
+                heapq.heappush(self.heap, (when, task_id))
+        if due: self.due.emit(due)
+        self.arm()
+
+
+class ReminderDialog(QDialog):
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.setWindowTitle("Напоминание")
+        self.setModal(False)
+        self.resize(400, 300)
+        layout = QVBoxLayout(self)
+        self.reminders_list = QListWidget()
+        self.reminders_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        layout.addWidget(self.reminders_list)
+
+        btns = QHBoxLayout()
+        snooze_btn, done_btn, close_btn = QPushButton("Отложить 5 мин"), QPushButton("Выполнено"), QPushButton("Закрыть")
+        for btn in (snooze_btn, done_btn, close_btn): btns.addWidget(btn)
+        layout.addLayout(btns)
+        snooze_btn.clicked.connect(self.snooze)
+        done_btn.clicked.connect(self.mark_done)
+        close_btn.clicked.connect(self.reject)
+
+    def add_tasks(self, task_ids):
+        shown = {self.reminders_list.item(i).data(Qt.ItemDataRole.UserRole)
+                 for i in range(self.reminders_list.count())}
+        for task_id in task_ids:
+            task = None if task_id in shown else self.db.get_task(task_id)
+            if task:
+                item = QListWidgetItem(f"{task[1]}\n{task[2]}\nПриоритет: {task[3]}")
+                item.setData(Qt.ItemDataRole.UserRole, task_id)
+                self.reminders_list.addItem(item)
+        count = self.reminders_list.count()
+        self.setWindowTitle("Напоминание" if count == 1 else f"Напоминания ({count})")
+
+    def take_selected(self):
+        # Действие применяется к выделенным напоминаниям, а если ничего не выделено - ко всем
+        items = self.reminders_list.selectedItems() or \
+            [self.reminders_list.item(i) for i in range(self.reminders_list.count())]
+        for item in items:
+            self.reminders_list.takeItem(self.reminders_list.row(item))
+        if not self.reminders_list.count(): self.accept()
+        return [item.data(Qt.ItemDataRole.UserRole) for item in items]
+
+    def snooze(self):
+        new_reminder = (datetime.datetime.now() + datetime.timedelta(minutes=5)).strftime('%Y-%m-%d %H:%M')
+        with self.db.transaction():
+            for task_id in self.take_selected():
+                task = self.db.get_task(task_id)
+                if task: self.db.update_task(task_id, task[1], task[2], task[3], task[4], task[6], new_reminder)
+
+    def mark_done(self):
+        # У повторяющейся задачи выполняется ближайшее повторение, серия остаётся открытой
+        with self.db.transaction():
+            for task_id in self.take_selected():
+                task = self.db.get_task(task_id)
+                if task and not self.db.complete_occurrence(task_id):
+                    self.db.update_task(task_id, task[1], task[2], task[3], "Готово", task[6], "")
+
+
+class CsvImportWorker(QThread):
+    progress = pyqtSignal(int, int, float)  # процент файла, импортировано строк, строк/с
+    done = pyqtSignal(int, int, bool, str)  # импортировано, пропущено, отменено, ошибка
+
+    def __init__(self, path, skip_duplicates=False, batch_size=5000, commit_rows=50000, parent=None):
+        super().__init__(parent)
+        self.path, self.skip_duplicates = path, skip_duplicates
+        self.batch_size, self.commit_rows = batch_size, commit_rows
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    @staticmethod
+    def content_hash(title, desc, prior, stat, deadline):
+        data = "\x1f".join((title, desc or "", prior or "", stat or "", deadline or "")).encode("utf-8")
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+    def normalize(self, rows, seen):
+        batch, skipped = [], 0
+        for row in rows:
+            if len(row) < 6 or not row[1].strip():
+                skipped += 1
+                continue
+            title, desc, prior, stat, created = row[1:6]
+            deadline = row[6] if len(row) > 6 else ""
+            reminder = row[7] if len(row) > 7 else ""
+            if prior not in PRIORITIES: prior = "Средний"
+            if stat not in STATUSES: stat = "В процессе"
+            if seen is not None:
+                key = self.content_hash(title, desc, prior, stat, deadline)
+                if key in seen:
+                    skipped += 1
+                    continue
+                seen.add(key)
+            batch.append((title, desc, prior, stat, created, deadline, reminder))
+        return batch, skipped
+
+    def run(self):
+        # У потока своё соединение: sqlite3-соединение нельзя делить между потоками
+        imported = skipped = pending = 0
+        conn, started = None, time.perf_counter()
+        try:
+            conn = connect_db(timeout=30)
+            seen = None
+            if self.skip_duplicates:
+                seen = {self.content_hash(*row) for row in conn.execute(
+                    "SELECT title, description, priority, status, deadline FROM tasks")}
+            size, read = max(os.path.getsize(self.path), 1), 0
+            with open(self.path, "rb") as f:
+                def lines():
+                    nonlocal read
+                    for raw in f:
+                        read += len(raw)
+                        yield raw.decode("utf-8-sig")
+                reader = csv.reader(lines())
+                next(reader, None)
+                while not self.cancelled:
+                    rows = [row for _, row in zip(range(self.batch_size), reader)]
+                    if not rows: break
+                    batch, batch_skipped = self.normalize(rows, seen)
+                    conn.executemany(TaskDB.INSERT_SQL, batch)
+                    imported, skipped, pending = imported + len(batch), skipped + batch_skipped, pending + len(batch)
+                    if pending >= self.commit_rows:
+                        conn.commit()
+                        pending = 0
+                    rate = imported / max(time.perf_counter() - started, 1e-6)
+                    self.progress.emit(int(read * 100 / size), imported, rate)
+            if self.cancelled:
+                conn.rollback()  # незафиксированная порция откатывается
+                imported -= pending
+            else:
+                conn.commit()
+            log(f"Импорт {self.path}", op="import", rows=imported, skipped=skipped,
+                duration_ms=elapsed_ms(started))
+            self.done.emit(imported, skipped, self.cancelled, "")
+        except (sqlite3.Error, OSError, UnicodeDecodeError, csv.Error) as e:
+            if conn: conn.rollback()
+            self.done.emit(imported - pending, skipped, self.cancelled, str(e))
+        finally:
+            if conn: conn.close()
+
+
+class ExportWorker(QThread):
+    HEADERS = ["ID", "Название", "Описание", "Приоритет", "Статус", "Создано", "Дедлайн", "Напоминание"]
+    progress = pyqtSignal(int, int)  # выгружено строк, всего строк
+    done = pyqtSignal(int, bool, str)  # выгружено, отменено, ошибка
+
+    def __init__(self, path, query, total, fetch_size=2000, parent=None):
+        super().__init__(parent)
+        self.path, (self.sql, self.params), self.total = path, query, total
+        self.fetch_size, self.cancelled = fetch_size, False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def open_output(self):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, "wt", encoding="utf-8", newline="")
+        return open(self.path, "w", encoding="utf-8", newline="")
+
+    def run(self):
+        exported, conn, started = 0, None, time.perf_counter()
+        json_lines = self.path.removesuffix(".gz").endswith(".jsonl")
+        keys = [field.strip() for field in TASK_FIELDS.split(",")]
+        try:
+            conn = connect_db(timeout=30)
+            attach_archive(conn)  # запрос режима "с архивом" читает и его
+            cur = conn.execute(self.sql, self.params)
+            with self.open_output() as f:
+                writer = None if json_lines else csv.writer(f)
+                if writer: writer.writerow(self.HEADERS)
+                # Строки идут из курсора порциями, в памяти не больше fetch_size задач
+                while not self.cancelled and (rows := cur.fetchmany(self.fetch_size)):
+                    if writer:
+                        writer.writerows(rows)
+                    else:
+                        f.writelines(json.dumps(dict(zip(keys, row)), ensure_ascii=False) + "\n" for row in rows)
+                    exported += len(rows)
+                    self.progress.emit(exported, self.total)
+            if self.cancelled:
+                os.remove(self.path)
+            else:
+                log(f"Экспорт {self.path}", op="export", rows=exported, duration_ms=elapsed_ms(started))
+            self.done.emit(exported, self.cancelled, "")
+        except (sqlite3.Error, OSError) as e:
+            self.done.emit(exported, self.cancelled, str(e))
+        finally:
+            if conn: conn.close()
+
+
+DELTA_FORMAT = "ela-delta"
+DELTA_FIELDS = ("title", "description", "priority", "status", "created", "deadline", "reminder")
+
+
+class DeltaExportWorker(ExportWorker):
+    # Дельта для синхронизации (JSON Lines): заголовок с ревизией среза - её передают как since в следующий
+    # раз, - затем {"op": "upsert", uuid, поля} для задач и {"op": "delete", uuid} для надгробий с ревизией
+    # больше since, по порядку ревизий. Надгробие задачи, перенесённой archive_done, - {"op": "archive",
+    # uuid, поля из архива}: это перенос, а не удаление. since=0 - все задачи. Id в дельту не попадают
+    def __init__(self, path, since, fetch_size=2000, parent=None):
+        super().__init__(path, ("", []), 0, fetch_size, parent)
+        self.since = since
+
+    def run(self):
+        exported, conn, started = 0, None, time.perf_counter()
+        since = self.since if self.since > 0 else -1  # у строк, заведённых до ревизий, ревизия 0
+        try:
+            conn = connect_db(timeout=30)
+            attach_archive(conn)
+            conn.execute("BEGIN")  # один снимок WAL: ревизия заголовка и строки согласованы
+            revision = conn.execute(f"SELECT {CURRENT_REVISION}").fetchone()[0] or 0
+            self.total = conn.execute("""SELECT (SELECT COUNT(*) FROM tasks WHERE revision > ?)
+                + (SELECT COUNT(*) FROM task_tombstones WHERE revision > ? AND uuid IS NOT NULL)""",
+                                      (since, since)).fetchone()[0]
+            cur = conn.execute(f"""SELECT revision, uuid, 'upsert', {', '.join(DELTA_FIELDS)} FROM tasks
+                WHERE revision > ? UNION ALL
+                SELECT t.revision, t.uuid, IIF(a.uuid IS NULL, 'delete', 'archive'),
+                {', '.join(f'a.{field}' for field in DELTA_FIELDS)} FROM task_tombstones AS t
+                LEFT JOIN archive.tasks AS a ON a.uuid = t.uuid
+                WHERE t.revision > ? AND t.uuid IS NOT NULL ORDER BY 1""", (since, since))
+            with self.open_output() as f:
+                f.write(json.dumps({"format": DELTA_FORMAT, "version": 1, "since": max(self.since, 0),
+                                    "revision": revision}) + "\n")
+                while not self.cancelled and (rows := cur.fetchmany(self.fetch_size)):
+                    for rev, uuid, op, *values in rows:
+                        record = {"op": op, "revision": rev, "uuid": uuid}
+                        if op != "delete": record.update(zip(DELTA_FIELDS, values))
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    exported += len(rows)
+                    self.progress.emit(exported, self.total)
+            conn.rollback()
+            if self.cancelled:
+                os.remove(self.path)
+            else:
+                # Ревизия среза - подсказка since для следующей дельты из окна
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO task_stats VALUES ('delta:exported', ?)", (revision,))
+                log(f"Дельта {self.path}", op="delta_export", rows=exported, since=self.since, revision=revision,
+                    duration_ms=elapsed_ms(started))
+            self.done.emit(exported, self.cancelled, "")
+        except (sqlite3.Error, OSError) as e:
+            self.done.emit(exported, self.cancelled, str(e))
+        finally:
+            if conn: conn.close()
+
+
+class DeltaImportWorker(CsvImportWorker):
+    # Применяет дельту DeltaExportWorker в порядке записей, сверяя uuid и с tasks, и с архивом:
+    # upsert задачи из архива возвращает её в tasks, archive переносит задачу в архив (или правит
+    # её там), delete удаляет отовсюду. Повторный импорт той же дельты ничего не меняет - совпадающая
+    # строка не перезаписывается и не получает новую ревизию; "пропущено" - записи без изменений
+    FIELDS, VALUES = ", ".join(DELTA_FIELDS), ", ".join(f":{field}" for field in DELTA_FIELDS)
+    UPSERT_SQL = f"""INSERT INTO tasks (uuid, {FIELDS}) SELECT :uuid, {VALUES}
+        WHERE NOT EXISTS (SELECT 1 FROM archive.tasks WHERE uuid = :uuid)
+        ON CONFLICT(uuid) DO UPDATE SET {', '.join(f'{field} = excluded.{field}' for field in DELTA_FIELDS)}
+        WHERE ({FIELDS}) IS NOT ({', '.join(f'excluded.{field}' for field in DELTA_FIELDS)})"""
+    RESTORE_SQL = f"""INSERT OR IGNORE INTO tasks ({TASK_FIELDS}, uuid)
+        SELECT {TASK_FIELDS}, uuid FROM archive.tasks WHERE uuid = :uuid"""
+    ARCHIVED_UPDATE_SQL = f"""UPDATE archive.tasks SET {', '.join(f'{field} = :{field}' for field in DELTA_FIELDS)},
+        {TYPED_DATES.format(':')} WHERE uuid = :uuid AND ({FIELDS}) IS NOT ({VALUES})"""
+    MOVE_SQL = f"""INSERT OR REPLACE INTO archive.tasks ({ARCHIVE_FIELDS}, archived)
+        SELECT {ARCHIVE_FIELDS}, datetime('now', 'localtime') FROM tasks WHERE uuid = :uuid"""
+    DELETE_SQL = "DELETE FROM tasks WHERE uuid = :uuid"
+    DELETE_ARCHIVED_SQL = "DELETE FROM archive.tasks WHERE uuid = :uuid"
+
+    @staticmethod
+    def execute(conn, sql, rows):
+        return conn.executemany(sql, rows).rowcount if rows else 0
+
+    def apply(self, conn, records):
+        # Подряд идущие записи одного вида - пачкой executemany; порядок видов записей сохраняется
+        changed = 0
+        for op, group in itertools.groupby(records, key=lambda record: record["op"]):
+            rows = [{"uuid": record["uuid"], **{field: record.get(field) for field in DELTA_FIELDS}}
+                    for record in group]
+            if op == "delete":
+                changed += sum(self.execute(conn, sql, rows) for sql in (self.DELETE_SQL, self.DELETE_ARCHIVED_SQL))
+                continue
+            uuids = [row["uuid"] for row in rows]
+            archived = {row[0] for row in conn.execute(
+                f"SELECT uuid FROM archive.tasks WHERE uuid IN ({','.join('?' * len(uuids))})", uuids)}
+            hot = [row for row in rows if row["uuid"] not in archived]
+            cold = [row for row in rows if row["uuid"] in archived]
+            if op == "upsert":
+                # Задача снова в работе у другой стороны - возвращается из архива с прежним id
+                for sql in (self.RESTORE_SQL, self.DELETE_ARCHIVED_SQL, self.UPSERT_SQL):
+                    self.execute(conn, sql, cold)
+                changed += len(cold) + self.execute(conn, self.UPSERT_SQL, hot)
+            else:
+                # Перенос как в archive_done: строка (при нужде - новая) обновляется в tasks, копируется
+                # в архив и удаляется; уже лежащая в архиве только правится
+                changed += self.execute(conn, self.ARCHIVED_UPDATE_SQL, cold)
+                self.execute(conn, self.UPSERT_SQL, hot)
+                self.execute(conn, self.MOVE_SQL, hot)
+                changed += self.execute(conn, self.DELETE_SQL, hot)
+        return changed
+
+    def run(self):
+        imported = skipped = 0
+        conn, started = None, time.perf_counter()
+        try:
+            size = max(os.path.getsize(self.path), 1)
+            with open(self.path, "rb") as raw:
+                f = gzip.open(raw, "rt", encoding="utf-8") if self.path.endswith(".gz") else \
+                    io.TextIOWrapper(raw, encoding="utf-8")
+                header = json.loads(f.readline() or "{}")
+                if header.get("format") != DELTA_FORMAT:
+                    raise ValueError("файл не является дельтой Ela")
+                conn = connect_db(timeout=30)
+                attach_archive(conn)
+                # Дельта применяется целиком или никак: частично применённую пришлось бы повторять
+                conn.execute("BEGIN IMMEDIATE")
+                while not self.cancelled:
+                    lines = [line for _, line in zip(range(self.batch_size), f)]
+                    if not lines: break
+                    records = [record for record in map(json.loads, lines)
+                               if record.get("uuid") and record.get("op") in ("upsert", "archive", "delete")]
+                    changed = self.apply(conn, records)
+                    imported, skipped = imported + changed, skipped + len(lines) - changed
+                    rate = (imported + skipped) / max(time.perf_counter() - started, 1e-6)
+                    self.progress.emit(int(raw.tell() * 100 / size), imported, rate)
+            if self.cancelled:
+                conn.rollback()
+                imported = 0
+            else:
+                conn.commit()
+            log(f"Дельта {self.path}", op="delta_import", rows=imported, skipped=skipped,
+                revision=header.get("revision"), duration_ms=elapsed_ms(started))
+            self.done.emit(imported, skipped, self.cancelled, "")
+        except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+            if conn: conn.rollback()
+            self.done.emit(0, skipped, self.cancelled, str(e))
+        finally:
+            if conn: conn.close()
+
+
+class BackupWorker(QThread):
+    progress = pyqtSignal(int, int)  # скопировано страниц, всего страниц
+    done = pyqtSignal(str, str)  # путь к бэкапу, ошибка
+
+    def __init__(self, path, pages=256, parent=None):
+        super().__init__(parent)
+        self.path, self.pages = path, pages
+
+    def copy(self, src, path, name):
+        # Схема name соединения src - в файл path.part; файл path появляется только после integrity_check
+        part, dst = path + ".part", sqlite3.connect(path + ".part")
+        try:
+            src.backup(dst, pages=self.pages, sleep=0.005, name=name,
+                       progress=lambda status, remaining, total: self.progress.emit(total - remaining, total))
+            check = dst.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            dst.close()
+        if check != "ok":
+            raise sqlite3.DatabaseError(f"integrity_check: {check}")
+        return part
+
+    def run(self):
+        # Connection.backup копирует базу порциями страниц на живом соединении,
+        # между порциями другие соединения могут писать - снимок всё равно согласован.
+        # Архив копируется парой с базой и после неё: перенос в архив сначала пишет в архив, так что
+        # задача, переезжающая во время бэкапа, окажется в обоих файлах (дубль снимет restore), но не потеряется
+        src, started = None, time.perf_counter()
+        try:
+            src = connect_db(timeout=30)
+            attach_archive(src)
+            main_part = self.copy(src, self.path, "main")
+            archive_part = self.copy(src, archive_path(self.path), "archive")
+            os.replace(archive_part, archive_path(self.path))
+            os.replace(main_part, self.path)  # файл базы последним: он и отмечает законченный бэкап
+            log(f"Бэкап {self.path}", op="backup", duration_ms=elapsed_ms(started))
+            self.done.emit(self.path, "")
+        except (sqlite3.Error, OSError) as e:
+            for part in (self.path + ".part", archive_path(self.path) + ".part"):
+                if os.path.exists(part): os.remove(part)
+            self.done.emit(self.path, str(e))
+        finally:
+            if src: src.close()
+
+
+class BackupService(QObject):
+    finished = pyqtSignal(str, str, bool)  # путь, ошибка, запущен вручную
+
+    def __init__(self, keep=BACKUP_KEEP, interval_minutes=AUTO_BACKUP_MINUTES, parent=None):
+        super().__init__(parent)
+        self.keep, self.worker, self.manual = keep, None, False
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(lambda: self.start(manual=False))
+        if interval_minutes: self.timer.start(interval_minutes * 60 * 1000)
+
+    def is_running(self):
+        return self.worker is not None
+
+    def start(self, manual=True):
+        if self.worker: return False
+        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.manual = manual
+        self.worker = BackupWorker(f"{BACKUP_DIR}/tasks_backup_{timestamp}.db", parent=self)
+        self.worker.done.connect(self.on_done)
+        self.worker.start()
+        return True
+
+    def on_done(self, path, error):
+        self.worker.deleteLater()
+        self.worker = None
+        if not error: self.prune()
+        self.finished.emit(path, error, self.manual)
+
+    def prune(self):
+        backups = sorted(f for f in os.listdir(BACKUP_DIR) if f.startswith('tasks_backup_') and f.endswith('.db')
+                         and not f.endswith('_archive.db'))
+        for old_backup in backups[:-self.keep] if self.keep else []:
+            for path in (f"{BACKUP_DIR}/{old_backup}", archive_path(f"{BACKUP_DIR}/{old_backup}")):
+                if os.path.exists(path): os.remove(path)
+
+    @staticmethod
+    def verify(path):
+        # Бэкап проверяется парой с архивом; у бэкапов до архива его файла нет
+        try:
+            for part in (path, archive_path(path)):
+                if part != path and not os.path.exists(part): continue
+                conn = sqlite3.connect(pathlib.Path(part).absolute().as_uri() + "?mode=ro", uri=True)
+                try:
+                    if conn.execute("PRAGMA integrity_check").fetchone()[0] != "ok": return False
+                finally:
+                    conn.close()
+            return True
+        except sqlite3.Error:
             return False
 
 
 class StatsWindow(QDialog):
-    def __init__(self, tasks, parent=None):
+    def __init__(self, stats, throughput, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Статистика")
         self.resize(400, 300)
         self.setModal(True)
         layout = QVBoxLayout(self)
 
-        total, done = len(tasks), sum(1 for t in tasks if t[4] == "Готово")
-        high = sum(1 for t in tasks if t[3] == "Высокий")
-        mid = sum(1 for t in tasks if t[3] == "Средний")
-        low = sum(1 for t in tasks if t[3] == "Низкий")
-        today = datetime.datetime.now().date()
-        overdue = sum(1 for t in tasks if
-                      t[6] and datetime.datetime.strptime(t[6], '%Y-%m-%d').date() < today and t[4] != "Готово")
-
         stats_group = QGroupBox("Общая статистика")
         stats_layout = QVBoxLayout()
-        stats_layout.addWidget(QLabel(f"Всего: {total}"))
-        stats_layout.addWidget(QLabel(f"Выполнено: {done}"))
-        stats_layout.addWidget(QLabel(f"В процессе: {total - done}"))
-        stats_layout.addWidget(QLabel(f"Просрочено: {overdue}"))
+        stats_layout.addWidget(QLabel(f"Всего: {stats['total']}"))
+        stats_layout.addWidget(QLabel(f"Выполнено: {stats['done']}"))
+        stats_layout.addWidget(QLabel(f"В процессе: {stats['pending']}"))
+        stats_layout.addWidget(QLabel(f"Просрочено: {stats['overdue']}"))
         stats_group.setLayout(stats_layout)
         layout.addWidget(stats_group)
 
         priority_group = QGroupBox("Приоритеты")
         priority_layout = QVBoxLayout()
-        priority_layout.addWidget(QLabel(f"Высокий: {high}"))
-        priority_layout.addWidget(QLabel(f"Средний: {mid}"))
-        priority_layout.addWidget(QLabel(f"Низкий: {low}"))
+        for priority, count in stats["priorities"].items():
+            priority_layout.addWidget(QLabel(f"{priority}: {count}"))
         priority_group.setLayout(priority_layout)
         layout.addWidget(priority_group)
 
+        weekly_group = QGroupBox("Выполнено по неделям")
+        weekly_layout = QVBoxLayout()
+        for start, count in throughput:
+            week = datetime.date.fromisoformat(start).strftime('%d.%m.%Y')
+            weekly_layout.addWidget(QLabel(f"Неделя с {week}: {count}"))
+        weekly_group.setLayout(weekly_layout)
+        layout.addWidget(weekly_group)
+
         close_btn = QPushButton("Закрыть")
         close_btn.clicked.connect(self.accept)
         layout.addWidget(close_btn)
 
 
+class DiagnosticsDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Диагностика")
+        self.resize(700, 600)
+        layout = QVBoxLayout(self)
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        layout.addWidget(self.text)
+
+        buttons = QHBoxLayout()
+        for title, slot in (("Обновить", self.refresh), ("Сбросить", self.reset), ("Сохранить JSON", self.save),
+                            ("Закрыть", self.accept)):
+            btn = QPushButton(title)
+            btn.clicked.connect(slot)
+            buttons.addWidget(btn)
+        layout.addLayout(buttons)
+        self.refresh()
+
+    def refresh(self):
+        if not PROFILER.enabled:
+            self.text.setPlainText("Профилирование выключено: запустите с --profile или ELA_PROFILE=1")
+            return
+        report = PROFILER.snapshot()
+        lines = [f"Порог медленных: {report['slow_ms']} мс", "", "Счётчики:"]
+        lines += [f"  {name}: {value}" for name, value in sorted(report["counters"].items())]
+        for kind, title in (("calls", "Вызовы"), ("queries", "Запросы")):
+            lines += ["", f"{title} (мс: p50 / p90 / p99 / max, число):"]
+            lines += [f"  {s['p50']:>9} {s['p90']:>9} {s['p99']:>9} {s['max']:>9} {s['count']:>6}  {name[:200]}"
+                      for name, s in report[kind].items()]
+        self.text.setPlainText("\n".join(lines))
+
+    def reset(self):
+        PROFILER.reset()
+        self.refresh()
+
+    def save(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Сохранить отчёт", PROFILE_FILE, "JSON (*.json)")
+        if not path: return
+        try:
+            PROFILER.dump(path)
+        except OSError as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить: {e}")
+
+
 class EditTaskDialog(QDialog):
-    def __init__(self, parent=None, data=None):
+    def __init__(self, parent=None, data=None, recurrence=""):
         super().__init__(parent)
         self.setWindowTitle("Редактирование" if data else "Добавление")
         self.setModal(True)
@@ -155,6 +2253,14 @@ class EditTaskDialog(QDialog):
         self.deadline_check.toggled.connect(self.deadline_input.setEnabled)
         deadline_layout.addWidget(self.deadline_check)
         deadline_layout.addWidget(self.deadline_input)
+        # Повторять можно только задачу с дедлайном: он - первое повторение серии
+        self.recurrence_choice = QComboBox()
+        self.recurrence_choice.addItem("Не повторять", "")
+        for rule, label in RECURRENCES.items():
+            self.recurrence_choice.addItem(label, rule)
+        self.recurrence_choice.setEnabled(False)
+        self.deadline_check.toggled.connect(self.recurrence_choice.setEnabled)
+        deadline_layout.addWidget(self.recurrence_choice)
 
         reminder_layout = QHBoxLayout()
         self.reminder_check = QCheckBox("Напоминание")
@@ -199,6 +2305,7 @@ class EditTaskDialog(QDialog):
             if data[6]:
                 self.deadline_input.setDate(QDate.fromString(data[6], 'yyyy-MM-dd'))
                 self.deadline_check.setChecked(True)
+                self.recurrence_choice.setCurrentIndex(max(self.recurrence_choice.findData(recurrence or ""), 0))
             if data[7]:
                 self.reminder_input.setDateTime(QDateTime.fromString(data[7], 'yyyy-MM-dd HH:mm'))
                 self.reminder_check.setChecked(True)
@@ -222,17 +2329,22 @@ class EditTaskDialog(QDialog):
         deadline = self.deadline_input.date().toString('yyyy-MM-dd') if self.deadline_check.isChecked() else ""
         reminder = self.reminder_input.dateTime().toString(
             'yyyy-MM-dd HH:mm') if self.reminder_check.isChecked() else ""
+        recurrence = self.recurrence_choice.currentData() if deadline else ""
         return (self.title_input.text().strip(), self.desc_input.toPlainText().strip(),
-                self.priority_choice.currentText(), self.status_choice.currentText(), deadline, reminder)
+                self.priority_choice.currentText(), self.status_choice.currentText(), deadline, reminder, recurrence)
 
 
 class CalendarWidget(QWidget):
-    def __init__(self, db, parent=None):
+    def __init__(self, db, parent=None, defer_load=False):
         super().__init__(parent)
         self.db, self.date_tasks = db, {}
         self.main_window = parent  # Сохраняем ссылку на главное окно
+        # Кэш агрегатов по месяцам: (год, месяц) -> {дата: (готово, просрочено, в процессе)}
+        self.month_counts, self.formatted_dates, self.cache_day = {}, set(), None
+        self.recurring_ids = set()  # серии на момент загрузки: их правка меняет много дней сразу
         self.setup_ui()
-        self.load_tasks_to_calendar()
+        if not defer_load: self.load_tasks_to_calendar()
+        db.change_listeners.append(self.on_tasks_changed)
 
     def setup_ui(self):
         layout = QVBoxLayout(self)
@@ -243,8 +2355,13 @@ class CalendarWidget(QWidget):
         self.add_to_date_btn = QPushButton("Добавить на дату")
         self.view_task_btn = QPushButton("Просмотреть")
         self.mark_done_btn = QPushButton("Выполнено")
+        self.heatmap_check = QCheckBox("Загруженность")
 
-        layout.addWidget(QLabel("Календарь:"))
+        header = QHBoxLayout()
+        header.addWidget(QLabel("Календарь:"))
+        header.addStretch()
+        header.addWidget(self.heatmap_check)
+        layout.addLayout(header)
         layout.addWidget(self.calendar)
         layout.addWidget(QLabel("Задачи на дату:"))
         layout.addWidget(self.tasks_list)
@@ -254,30 +2371,89 @@ class CalendarWidget(QWidget):
         layout.addLayout(btn_layout)
 
         self.calendar.selectionChanged.connect(self.on_date_selected)
+        self.calendar.currentPageChanged.connect(self.refresh_calendar)
+        self.heatmap_check.toggled.connect(self.refresh_calendar)
         self.add_to_date_btn.clicked.connect(self.add_task_to_date)
         self.view_task_btn.clicked.connect(self.view_selected_task)
         self.mark_done_btn.clicked.connect(self.mark_task_done)
         self.tasks_list.itemDoubleClicked.connect(self.view_task_from_list)
 
+    @profiled
     def load_tasks_to_calendar(self):
-        tasks = self.db.get_tasks()
-        today = QDate.currentDate()
-        for task in tasks:
-            if task[6]:
-                try:
-                    task_date = QDate.fromString(task[6], 'yyyy-MM-dd')
-                    fmt = QTextCharFormat()
-                    if task[4] == "Готово":
-                        fmt.setBackground(QColor(200, 255, 200))
-                    elif task_date < today:
-                        fmt.setBackground(QColor(255, 200, 200))
-                    else:
-                        fmt.setBackground(QColor(255, 255, 200))
-                    self.calendar.setDateTextFormat(task_date, fmt)
-                except:
-                    continue
+        self.month_counts.clear()
+        self.recurring_ids = set(self.db.get_recurrences())
+        self.refresh_calendar()
+        self.on_date_selected()
+
+    def visible_months(self):
+        year, month = self.calendar.yearShown(), self.calendar.monthShown()
+        return [((year * 12 + month - 1 + shift) // 12, (month - 1 + shift) % 12 + 1) for shift in (-1, 0, 1)]
+
+    def refresh_calendar(self):
+        if self.cache_day != datetime.date.today():  # после полуночи "просрочено" считается заново
+            self.month_counts.clear()
+            self.cache_day = datetime.date.today()
+        counts = {}
+        for year, month in self.visible_months():
+            if (year, month) not in self.month_counts:
+                start = datetime.date(year, month, 1)
+                end = (start + datetime.timedelta(days=31)).replace(day=1) - datetime.timedelta(days=1)
+                self.month_counts[year, month] = {row[0]: row[1:] for row in
+                                                  self.db.get_day_counts(start.isoformat(), end.isoformat())}
+            counts.update(self.month_counts[year, month])
+        for date in self.formatted_dates - counts.keys():
+            self.calendar.setDateTextFormat(QDate.fromString(date, 'yyyy-MM-dd'), QTextCharFormat())
+        busiest = max((sum(c) for c in counts.values()), default=0)
+        for date, day_counts in counts.items():
+            self.calendar.setDateTextFormat(QDate.fromString(date, 'yyyy-MM-dd'), self.day_format(day_counts, busiest))
+        self.formatted_dates = set(counts)
+
+    def on_tasks_changed(self, changes):
+        # Для правок из другого процесса прежний дедлайн неизвестен - перечитываются видимые месяцы;
+        # так же и для правки серии (в том числе только что ставшей повторяющейся) двигает все её повторения
+        ids = {(new or old)[0] for kind, old, new in changes if kind != "reloaded"}
+        if any(kind == "reloaded" or kind == "updated" and old is None for kind, old, _ in changes) or \
+                ids & (self.recurring_ids | set(self.db.get_recurrences())):
+            self.load_tasks_to_calendar()
+            return
+        dates = set()
+        for kind, old, new in changes:
+            if old: dates.add(old[6])
+            if new: dates.add(new[6])
+        self.refresh_dates(dates)
+
+    @profiled
+    def refresh_dates(self, dates):
+        # После правки перечитываются только затронутые дни, а не весь месяц
+        dates = sorted({d for d in dates if d})
+        if not dates: return
+        fresh = {row[0]: row[1:] for row in self.db.get_day_counts(dates=dates)}
+        for date in dates:
+            key = (int(date[:4]), int(date[5:7]))
+            if key in self.month_counts:
+                if date in fresh:
+                    self.month_counts[key][date] = fresh[date]
+                else:
+                    self.month_counts[key].pop(date, None)
+        self.refresh_calendar()
         self.on_date_selected()
 
+    def day_format(self, counts, busiest):
+        done, overdue, pending = counts
+        fmt = QTextCharFormat()
+        PROFILER.count("calendar_formats")
+        if self.heatmap_check.isChecked():
+            k = (done + overdue + pending) / busiest if busiest else 0
+            fmt.setBackground(QColor(255, int(255 - 120 * k), int(255 - 200 * k)))
+        elif overdue:
+            fmt.setBackground(QColor(255, 200, 200))
+        elif pending:
+            fmt.setBackground(QColor(255, 255, 200))
+        else:
+            fmt.setBackground(QColor(200, 255, 200))
+        fmt.setToolTip(f"Готово: {done}\nПросрочено: {overdue}\nВ процессе: {pending}")
+        return fmt
+
     def on_date_selected(self):
         selected_date = self.calendar.selectedDate().toString('yyyy-MM-dd')
         tasks = self.db.get_tasks_by_date(selected_date)
@@ -297,27 +2473,22 @@ class CalendarWidget(QWidget):
         dlg.deadline_check.setChecked(True)
         dlg.deadline_input.setDate(selected_date)
         if dlg.exec():
-            t, d, p, s, deadline, reminder = dlg.get_data()
-            if self.db.add_task(t, d, p, s, deadline, reminder):
-                # Обновляем и календарь, и главное окно
-                self.load_tasks_to_calendar()
-                if self.main_window:
-                    self.main_window.load_tasks()
+            t, d, p, s, deadline, reminder, recurrence = dlg.get_data()
+            self.db.add_task(t, d, p, s, deadline, reminder, recurrence)
 
     def view_selected_task(self):
         if self.tasks_list.currentItem(): self.view_task_from_list(self.tasks_list.currentItem())
 
     def view_task_from_list(self, item):
         task_id = item.data(Qt.ItemDataRole.UserRole)
-        task = self.date_tasks.get(task_id)
+        # В списке дня у серии - строка повторения с его датой, а редактируется сама задача
+        task = self.db.get_task(task_id) if task_id in self.recurring_ids else self.date_tasks.get(task_id)
         if task:
-            dlg = EditTaskDialog(self, data=task)
+            recurrence = self.db.get_recurrence(task_id)
+            dlg = EditTaskDialog(self, data=task, recurrence=recurrence[0] if recurrence else "")
             if dlg.exec():
-                t, d, p, s, deadline, reminder = dlg.get_data()
-                if self.db.update_task(task_id, t, d, p, s, deadline, reminder):
-                    self.load_tasks_to_calendar()
-                    if self.main_window:
-                        self.main_window.load_tasks()
+                t, d, p, s, deadline, reminder, recurrence = dlg.get_data()
+                self.db.update_task(task_id, t, d, p, s, deadline, reminder, recurrence)
 
     def mark_task_done(self):
         current_item = self.tasks_list.currentItem()
@@ -327,11 +2498,11 @@ class CalendarWidget(QWidget):
             if task and task[4] != "Готово":
                 if QMessageBox.question(self, "Подтверждение",
                                         "Отметить как выполненную?") == QMessageBox.StandardButton.Yes:
-                    if self.db.update_task(task_id, task[1], task[2], task[3], "Готово", task[6],
-                                           task[7] if len(task) > 7 else ""):
-                        self.load_tasks_to_calendar()
-                        if self.main_window:
-                            self.main_window.load_tasks()
+                    if task_id in self.recurring_ids:
+                        self.db.complete_occurrence(task_id, day_number(datetime.date.fromisoformat(task[6])))
+                    else:
+                        self.db.update_task(task_id, task[1], task[2], task[3], "Готово", task[6],
+                                            task[7] if len(task) > 7 else "")
 
 
 class MainWindow(QMainWindow):
@@ -339,14 +2510,74 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.setWindowTitle("Менеджер задач")
         self.resize(1400, 800)
-        self.db = TaskDB()
+        started = time.perf_counter()
+        self.db = TaskDB(error_handler=lambda title, message: QMessageBox.critical(self, title, message))
+        STARTUP_TIMES["db_open_ms"] = elapsed_ms(started)
+        self.async_db = AsyncDB(parent=self)
+        self.async_db.busy_changed.connect(self.set_busy)
+        self.async_db.error.connect(lambda message: QMessageBox.critical(self, "Ошибка", message))
+        self.stats, self.total_tasks = {"done": 0, "overdue": 0}, 0
+        self.filter_generation, self.filter_pending, self.filtered_count = 0, False, 0
+        self.archived_count = 0  # задач в архиве, считается при включении режима "С архивом"
+        self.filter_requests = []  # id запросов AsyncDB текущего поколения фильтра
+        self.all_filtered_selected = False
         self.setup_ui()
         self.setup_shortcuts()
+        # До первой отрисовки - только первый экран задач; остальное после показа окна
+        self.total_tasks = self.filtered_count = self.db.count_tasks()
+        self.fill_table(*self.db.fetch_page(self.current_filters(), *self.task_model.sort_args(), limit=FIRST_PAGE))
+        self.db.change_listeners.append(self.on_tasks_changed)
+        self.reminder_dialog = None
+        self.reminder_scheduler = ReminderScheduler(self.db, self)
+        self.reminder_scheduler.due.connect(self.show_reminders)
+        self.backup_service = BackupService(parent=self)
+        self.backup_service.finished.connect(self.on_backup_done)
+        # Правки других окон и скриптов в той же базе приходят подписчикам тем же путём, что и свои
+        self.change_timer = QTimer(self)
+        self.change_timer.timeout.connect(self.db.poll_changes)
+        self.change_timer.start(POLL_CHANGES_MS)
+        self.import_worker = self.export_worker = None
+        # Колоночный индекс в памяти (--memory-index): счётчики фильтра и проверка правок без SQL
+        self.index_enabled = "--memory-index" in sys.argv or os.environ.get("ELA_MEMORY_INDEX") == "1"
+        self.task_index, self.index_changes = None, None
+        self.started_up = False
+        QTimer.singleShot(500, self.finish_startup)  # если окно так и не отрисуется
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if "first_paint_ms" not in STARTUP_TIMES:
+            STARTUP_TIMES["first_paint_ms"] = elapsed_ms(STARTUP_STARTED)
+            QTimer.singleShot(0, self.finish_startup)
+
+    def finish_startup(self):
+        # Календарь, статистика, полный список и очередь напоминаний - уже после первой отрисовки
+        if self.started_up: return
+        self.started_up = True
         self.load_tasks()
-        self.reminder_timer = QTimer()
-        self.reminder_timer.timeout.connect(self.check_reminders)
-        self.reminder_timer.start(30000)
-        self.shown_reminders = set()
+        QTimer.singleShot(0, self.reminder_scheduler.load)
+        QTimer.singleShot(0, self.report_startup)
+
+    def report_startup(self):
+        STARTUP_TIMES["ready_ms"] = elapsed_ms(STARTUP_STARTED)
+        log("Запуск", op="startup", **STARTUP_TIMES)
+        if "--startup-report" in sys.argv:
+            print(json.dumps(STARTUP_TIMES))
+
+    def closeEvent(self, event):
+        # Фоновые операции дожидаемся, чтобы не оборвать транзакцию или бэкап на середине
+        for worker in (self.import_worker, self.export_worker, self.backup_service.worker):
+            if worker:
+                if hasattr(worker, "cancel"): worker.cancel()
+                worker.wait()
+        self.async_db.close()
+        self.db.close()
+        if PROFILER.enabled:
+            try:
+                PROFILER.dump()
+            except OSError:
+                pass
+        ACTIVITY_LOG.close()
+        super().closeEvent(event)
 
     def setup_ui(self):
         central_widget = QWidget()
@@ -356,7 +2587,8 @@ class MainWindow(QMainWindow):
         left_widget, right_widget = QWidget(), QWidget()
         left_layout, right_layout = QVBoxLayout(left_widget), QVBoxLayout(right_widget)
 
-        self.calendar_widget = CalendarWidget(self.db, self)  # Передаем self как родителя
+        # Передаем self как родителя; календарь заполнится после первой отрисовки окна
+        self.calendar_widget = CalendarWidget(self.db, self, defer_load=True)
         right_layout.addWidget(self.calendar_widget)
 
         control = QHBoxLayout()
@@ -370,9 +2602,10 @@ class MainWindow(QMainWindow):
         self.restore_btn = QPushButton("Восстановить")
         self.export_btn = QPushButton("Экспорт")
         self.import_btn = QPushButton("Импорт")
+        self.archive_btn = QPushButton("В архив")
 
         buttons = [self.add_btn, self.edit_btn, self.delete_btn, self.stats_btn,
-                   self.backup_btn, self.restore_btn, self.export_btn, self.import_btn]
+                   self.backup_btn, self.restore_btn, self.export_btn, self.import_btn, self.archive_btn]
 
         for btn in buttons:
             btn.setFixedHeight(35)
@@ -389,32 +2622,46 @@ class MainWindow(QMainWindow):
         self.status_filter.addItems(["Все статусы", "В процессе", "Готово"])
         self.deadline_filter = QComboBox()
         self.deadline_filter.addItems(["Все задачи", "Просроченные", "Сегодня", "На этой неделе"])
+        # По умолчанию таблица, календарь и статистика работают только с задачами вне архива
+        self.archive_check = QCheckBox("С архивом")
 
         for label, widget in [("Поиск:", self.search_input), ("Приоритет:", self.priority_filter),
                               ("Статус:", self.status_filter), ("Дедлайн:", self.deadline_filter)]:
             filter_bar.addWidget(QLabel(label))
             filter_bar.addWidget(widget)
+        filter_bar.addWidget(self.archive_check)
         left_layout.addLayout(filter_bar)
 
-        self.table = QTableWidget()
-        self.table.setColumnCount(8)
-        self.table.setHorizontalHeaderLabels(
-            ["ID", "Название", "Описание", "Приоритет", "Статус", "Создано", "Дедлайн", "Напоминание"])
+        self.task_model = TaskTableModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.task_model)
         self.table.verticalHeader().setVisible(False)
         self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
         self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
-        self.table.setSortingEnabled(True)
+        self.table.setSortingEnabled(True)  # сортирует SQL: модель перезапрашивает первую страницу
         self.table.setAlternatingRowColors(True)
         self.table.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
 
         header = self.table.horizontalHeader()
         header.setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
-        for i in [0, 3, 4, 5, 6, 7]: header.setSectionResizeMode(i, QHeaderView.ResizeMode.ResizeToContents)
+        # Ширины по образцу значения, а не ResizeToContents: тот на каждый сброс модели опрашивал бы
+        # data() у всех загруженных строк, а не только у видимых
+        metrics = self.table.fontMetrics()
+        for i, sample in ((0, "000000"), (3, "Приоритет"), (4, "В процессе"), (5, "2000-00-00 00:00"),
+                          (6, "2000-00-00"), (7, "2000-00-00 00:00")):
+            header.setSectionResizeMode(i, QHeaderView.ResizeMode.Interactive)
+            text = max(sample, TaskTableModel.HEADERS[i], key=metrics.horizontalAdvance)
+            header.resizeSection(i, metrics.horizontalAdvance(text) + 24)
 
         left_layout.addWidget(self.table)
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
+        self.busy_indicator = QProgressBar()
+        self.busy_indicator.setRange(0, 0)
+        self.busy_indicator.setMaximumWidth(120)
+        self.busy_indicator.setVisible(False)
+        self.status_bar.addPermanentWidget(self.busy_indicator)
 
         splitter.addWidget(left_widget)
         splitter.addWidget(right_widget)
@@ -429,6 +2676,7 @@ class MainWindow(QMainWindow):
         QShortcut(QKeySequence("Ctrl+E"), self).activated.connect(self.edit_task)
         QShortcut(QKeySequence("Delete"), self).activated.connect(self.delete_task)
         QShortcut(QKeySequence("Ctrl+F"), self).activated.connect(self.search_input.setFocus)
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self).activated.connect(lambda: DiagnosticsDialog(self).exec())
 
     def connect_signals(self):
         self.add_btn.clicked.connect(self.add_task)
@@ -439,244 +2687,479 @@ class MainWindow(QMainWindow):
         self.restore_btn.clicked.connect(self.restore_backup)
         self.export_btn.clicked.connect(self.export_csv)
         self.import_btn.clicked.connect(self.import_csv)
-
-        self.search_input.textChanged.connect(self.update_filters)
-        self.priority_filter.currentTextChanged.connect(self.update_filters)
-        self.status_filter.currentTextChanged.connect(self.update_filters)
-        self.deadline_filter.currentTextChanged.connect(self.update_filters)
-
+        self.archive_btn.clicked.connect(self.archive_done)
+
+        # Поиск запускается после паузы в наборе, а не на каждый символ,
+        # а смена фильтров в одном проходе цикла событий даёт один запрос
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.timeout.connect(self.apply_filters)
+        self.search_input.textChanged.connect(lambda: self.filter_timer.start(250))
+        for combo in (self.priority_filter, self.status_filter, self.deadline_filter):
+            combo.currentTextChanged.connect(lambda: self.filter_timer.start(0))
+        self.archive_check.toggled.connect(lambda: self.filter_timer.start(0))
+
+        self.task_model.fetch_requested.connect(self.load_more)
+        self.task_model.sort_requested.connect(self.apply_filters)
         self.table.customContextMenuRequested.connect(self.show_context_menu)
-        self.table.itemSelectionChanged.connect(self.update_status_bar)
+        self.table.selectionModel().selectionChanged.connect(self.on_selection_changed)
 
+    @profiled
     def load_tasks(self):
-        tasks = self.db.get_tasks()
-        self.all_tasks = tasks
-        self.apply_filters(tasks)
-        # Обновляем календарь при каждой загрузке задач
+        self.total_tasks = self.db.count_tasks()
+        self.refresh_stats()
+        if self.index_enabled: self.build_index()
+        self.apply_filters()
         self.calendar_widget.load_tasks_to_calendar()
 
-    def apply_filters(self, tasks):
-        search = self.search_input.text().lower()
+    def refresh_stats(self):
+        self.async_db.call("get_stats", callback=self.on_stats)
+
+    def on_stats(self, stats):
+        self.stats = stats
+        self.update_status_bar()
+
+    def set_busy(self, busy):
+        self.busy_indicator.setVisible(busy)
+        if busy:
+            self.table.viewport().setCursor(Qt.CursorShape.BusyCursor)
+        else:
+            self.table.viewport().unsetCursor()
+
+    @profiled
+    def on_tasks_changed(self, changes):
+        # Правки приходят от TaskDB построчно: таблица патчится, а не перечитывается
+        self.refresh_stats()
+        self.total_tasks = self.db.count_tasks()
+        self.update_index(changes)
+        if len(changes) > TaskTableModel.MAX_PATCH or self.filter_pending or \
+                any(kind == "reloaded" for kind, _, _ in changes):
+            # Ответ фильтра, запрошенный до правки, мог её не увидеть - перезапрашиваем
+            self.apply_filters()
+            return
+        ids, filters = [new[0] for _, _, new in changes if new], self.current_filters()
+        visible = self.task_index.matching(ids, **filters) if self.task_index else self.db.filter_ids(ids, **filters)
+        self.task_model.apply_changes(changes, visible)
+        self.refresh_count()
+        self.update_status_bar()
+
+    def build_index(self):
+        # Правки, пришедшие, пока индекс строится в потоке, применяются к нему по готовности
+        if self.index_changes is not None: return
+        self.index_changes = []
+        self.async_db.call("build_index", callback=self.on_index_built)
+
+    def on_index_built(self, index):
+        changes, self.index_changes = self.index_changes, None
+        if index is None: return
+        if any(kind == "reloaded" for kind, _, _ in changes):
+            self.build_index()
+            return
+        index.apply(changes)
+        index.recurring = self.db.get_recurrences()
+        self.task_index = index
+        self.refresh_count()
+
+    def update_index(self, changes):
+        if self.index_changes is not None:
+            self.index_changes += changes
+        elif self.task_index and any(kind == "reloaded" for kind, _, _ in changes):
+            self.task_index = None
+            self.build_index()
+        elif self.task_index:
+            self.task_index.apply(changes)
+            self.task_index.recurring = self.db.get_recurrences()
+
+    def current_filters(self):
         p_filter = self.priority_filter.currentText()
         s_filter = self.status_filter.currentText()
         d_filter = self.deadline_filter.currentText()
-        today = datetime.datetime.now().date()
-        week_end = today + datetime.timedelta(days=7)
-
-        filtered = []
-        for t in tasks:
-            if search and search not in t[1].lower() and search not in t[2].lower(): continue
-            if p_filter != "Все приоритеты" and t[3] != p_filter: continue
-            if s_filter != "Все статусы" and t[4] != s_filter: continue
-            if d_filter != "Все задачи" and t[6]:
-                try:
-                    deadline = datetime.datetime.strptime(t[6], '%Y-%m-%d').date()
-                    if d_filter == "Просроченные" and (deadline >= today or t[4] == "Готово"):
-                        continue
-                    elif d_filter == "Сегодня" and deadline != today:
-                        continue
-                    elif d_filter == "На этой неделе" and not (today <= deadline <= week_end):
-                        continue
-                except:
-                    continue
-            elif d_filter != "Все задачи" and not t[6]:
-                continue
-            filtered.append(t)
-        self.fill_table(filtered)
-
-    def update_filters(self):
-        self.apply_filters(self.all_tasks)
-
-    def fill_table(self, tasks):
-        self.table.setRowCount(len(tasks))
-        today = datetime.datetime.now().date()
-        for row, task in enumerate(tasks):
-            for col, value in enumerate(task):
-                item = QTableWidgetItem(str(value))
-                if col == 3:
-                    if value == "Высокий":
-                        item.setBackground(QColor(255, 200, 200))
-                    elif value == "Средний":
-                        item.setBackground(QColor(255, 255, 200))
-                    else:
-                        item.setBackground(QColor(200, 255, 200))
-                elif col == 4 and value == "Готово":
-                    item.setBackground(QColor(200, 255, 200))
-                elif col == 6 and value:
-                    try:
-                        deadline = datetime.datetime.strptime(value, '%Y-%m-%d').date()
-                        if deadline < today and task[4] != "Готово":
-                            item.setBackground(QColor(255, 150, 150))
-                        elif (deadline - today).days <= 1 and task[4] != "Готово":
-                            item.setBackground(QColor(255, 200, 150))
-                    except:
-                        pass
-                self.table.setItem(row, col, item)
+        return {"search": self.search_input.text().strip(),
+                "priority": None if p_filter == "Все приоритеты" else p_filter,
+                "status": None if s_filter == "Все статусы" else s_filter,
+                "deadline": None if d_filter == "Все задачи" else d_filter}
+
+    @profiled
+    def apply_filters(self):
+        # Запросы прошлого фильтра отменяются (выполняющийся - прерывается), ответы устаревших
+        # поколений отбрасываются: в таблицу попадает только последний. Первая страница идёт раньше счётчика
+        self.filter_timer.stop()
+        self.async_db.cancel(self.filter_requests)
+        self.filter_generation += 1
+        self.filter_pending, self.filter_requests = True, []
+        self.fetch_page()
+        self.refresh_count()
+        if self.archive_check.isChecked():
+            self.async_db.call("count_archived", callback=self.on_archived_counted)
+
+    def fetch_page(self, after=None):
+        generation = self.filter_generation
+        self.filter_requests.append(self.async_db.call(
+            "fetch_page", self.current_filters(), *self.task_model.sort_args(), after,
+            archive=self.archive_check.isChecked(), callback=lambda page: self.on_page(generation, after, page)))
+
+    def load_more(self):
+        # Пока первая страница нового фильтра не пришла, следующую страницу старого не просим;
+        # fetching модели сбросит fill_table
+        if not self.filter_pending: self.fetch_page(self.task_model.after)
+
+    def on_page(self, generation, after, page):
+        if generation != self.filter_generation: return
+        if after is None:
+            self.filter_pending = False
+            self.fill_table(*page)
+        else:
+            self.task_model.append_tasks(*page)
+            self.update_status_bar()
+
+    def refresh_count(self):
+        archive, filters = self.archive_check.isChecked(), self.current_filters()
+        # Архива в индексе нет, а поиск по нему - проход по строкам: такие счётчики считает рабочий поток
+        if self.task_index and not archive and not filters["search"]:
+            self.filtered_count = self.task_index.count(**filters)
+            self.update_status_bar()
+            return
+        generation = self.filter_generation
+        self.filter_requests.append(self.async_db.call(
+            "count_filtered", callback=lambda count: self.on_counted(generation, count), archive=archive, **filters))
+
+    def on_counted(self, generation, count):
+        if generation != self.filter_generation: return
+        self.filtered_count = count
+        self.update_status_bar()
+
+    @profiled
+    def fill_table(self, tasks, after=None):
+        self.all_filtered_selected = False
+        self.task_model.set_tasks(tasks, after)
+        self.update_status_bar()
+
+    def current_task(self):
+        return self.task_model.task_at(self.table.currentIndex().row())
+
+    def on_archived_counted(self, count):
+        self.archived_count = count
         self.update_status_bar()
 
     def update_status_bar(self):
-        total, filtered = len(self.all_tasks), self.table.rowCount()
+        total, filtered = self.total_tasks, self.filtered_count
         selected = len(self.table.selectionModel().selectedRows())
         status_text = f"Всего: {total}"
+        if self.archive_check.isChecked():
+            total += self.archived_count
+            status_text += f" + в архиве: {self.archived_count}"
         if total != filtered: status_text += f" (отфильтровано: {filtered})"
-        if selected > 0: status_text += f" | Выбрано: {selected}"
+        if self.all_filtered_selected:
+            status_text += " | Выбраны все по фильтру"
+        elif selected > 0:
+            status_text += f" | Выбрано: {selected}"
+        status_text += f" | Готово: {self.stats['done']} | Просрочено: {self.stats['overdue']}"
         self.status_bar.showMessage(status_text)
 
     def add_task(self):
         dlg = EditTaskDialog(self)
         if dlg.exec():
-            t, d, p, s, deadline, reminder = dlg.get_data()
-            if self.db.add_task(t, d, p, s, deadline, reminder):
-                self.load_tasks()
+            t, d, p, s, deadline, reminder, recurrence = dlg.get_data()
+            self.db.add_task(t, d, p, s, deadline, reminder, recurrence)
 
     def edit_task(self):
-        row = self.table.currentRow()
-        if row < 0:
+        task = self.current_task()
+        if not task:
             QMessageBox.warning(self, "Ошибка", "Выберите задачу")
             return
-        task = [self.table.item(row, i).text() for i in range(8)]
-        dlg = EditTaskDialog(self, data=task)
+        if self.db.get_task(task[0]) is None:
+            QMessageBox.information(self, "Архив", "Задача в архиве - сначала верните её из архива")
+            return
+        recurrence = self.db.get_recurrence(task[0])
+        dlg = EditTaskDialog(self, data=task, recurrence=recurrence[0] if recurrence else "")
         if dlg.exec():
-            t, d, p, s, deadline, reminder = dlg.get_data()
-            if self.db.update_task(task[0], t, d, p, s, deadline, reminder):
-                self.load_tasks()
+            t, d, p, s, deadline, reminder, recurrence = dlg.get_data()
+            self.db.update_task(task[0], t, d, p, s, deadline, reminder, recurrence)
 
     def delete_task(self):
-        row = self.table.currentRow()
-        if row < 0:
+        ids = self.selected_ids()
+        if not ids:
             QMessageBox.warning(self, "Ошибка", "Выберите задачу")
             return
-        task_name = self.table.item(row, 1).text()
-        if QMessageBox.question(self, "Подтверждение", f"Удалить '{task_name}'?") == QMessageBox.StandardButton.Yes:
-            task_id = self.table.item(row, 0).text()
-            if self.db.delete_task(task_id):
-                self.load_tasks()
+        if not self.editable_selection(): return
+        if len(ids) == 1 and not self.all_filtered_selected:
+            question = f"Удалить '{self.task_model.task_at(self.task_model.row_of(ids[0]))[1]}'?"
+        else:
+            count = self.filtered_count if self.all_filtered_selected else len(ids)
+            question = f"Удалить выбранные задачи ({count})?"
+        if QMessageBox.question(self, "Подтверждение", question) == QMessageBox.StandardButton.Yes:
+            self.bulk_action(self.db.delete_tasks)
 
     def show_context_menu(self, position):
         menu = QMenu(self)
-        actions = ["Редактировать", "Удалить", "Отметить выполненной", "В процессе"]
-        for text in actions:
-            menu.addAction(text)
-        action = menu.exec(self.table.mapToGlobal(position))
-        if action:
-            if action.text() == "Редактировать":
-                self.edit_task()
-            elif action.text() == "Удалить":
-                self.delete_task()
-            elif action.text() == "Отметить выполненной":
-                self.mark_task_status("Готово")
-            elif action.text() == "В процессе":
-                self.mark_task_status("В процессе")
+        # Правки идут только по tasks: с архивными строками в выделении доступен лишь возврат из архива
+        editable = not self.archived_in_selection()
+        actions = [menu.addAction("Редактировать", self.edit_task), menu.addAction("Удалить", self.delete_task),
+                   menu.addAction("Отметить выполненной", lambda: self.mark_task_status("Готово")),
+                   menu.addAction("В процессе", lambda: self.mark_task_status("В процессе"))]
+        menu.addSeparator()
+        priority_menu = menu.addMenu("Приоритет")
+        for priority in PRIORITIES:
+            priority_menu.addAction(priority, lambda p=priority: self.bulk_action(self.db.set_priority, p))
+        actions += [priority_menu.menuAction(), menu.addAction("Сдвинуть дедлайн...", self.shift_selected_deadlines),
+                    menu.addAction("Снять напоминания", lambda: self.bulk_action(self.db.clear_reminders))]
+        for action in actions: action.setEnabled(editable)
+        if self.archive_check.isChecked():
+            menu.addAction("Вернуть из архива", lambda: self.db.unarchive(self.selected_ids()))
+        menu.addSeparator()
+        menu.addAction("Выбрать все по фильтру", self.select_all_filtered)
+        menu.exec(self.table.mapToGlobal(position))
+
+    def select_all_filtered(self):
+        # Групповые действия пойдут одним SQL-запросом по текущему фильтру, а не по списку id
+        self.table.selectAll()
+        self.all_filtered_selected = True
+        self.update_status_bar()
+
+    def on_selection_changed(self):
+        if len(self.table.selectionModel().selectedRows()) < self.task_model.rowCount():
+            self.all_filtered_selected = False
+        self.update_status_bar()
+
+    def selected_ids(self):
+        return [self.task_model.task_at(index.row())[0] for index in self.table.selectionModel().selectedRows()]
+
+    def archived_in_selection(self):
+        # Выбор "все по фильтру" в режиме "с архивом" включает архив, а SQL групповых действий - нет
+        if not self.archive_check.isChecked(): return False
+        if self.all_filtered_selected: return True
+        ids = self.selected_ids()
+        return len(self.db.filter_ids(ids)) < len(ids)
+
+    def editable_selection(self):
+        if not self.archived_in_selection(): return True
+        QMessageBox.information(self, "Архив", "В выделении есть задачи из архива - сначала верните их из архива")
+        return False
+
+    def bulk_action(self, operation, *args):
+        if not self.editable_selection(): return 0
+        if self.all_filtered_selected:
+            return operation(*args, filters=self.current_filters())
+        ids = self.selected_ids()
+        return operation(*args, ids=ids) if ids else 0
+
+    def shift_selected_deadlines(self):
+        if not self.editable_selection(): return
+        days, ok = QInputDialog.getInt(self, "Сдвиг дедлайна", "На сколько дней (можно отрицательное):", 1,
+                                       -3650, 3650)
+        if ok and days: self.bulk_action(self.db.shift_deadlines, days)
 
     def mark_task_status(self, status):
-        row = self.table.currentRow()
-        if row < 0: return
-        task_id = self.table.item(row, 0).text()
-        task = [self.table.item(row, i).text() for i in range(8)]
-        if self.db.update_task(task_id, task[1], task[2], task[3], status, task[6], task[7]):
-            self.load_tasks()
+        # Выделенная повторяющаяся задача закрывает ближайшее повторение, а не всю серию;
+        # групповая операция по фильтру меняет статус как есть
+        if not self.editable_selection(): return
+        recurring = self.db.get_recurrences() if status == "Готово" and not self.all_filtered_selected else {}
+        if not recurring:
+            self.bulk_action(self.db.set_status, status)
+            return
+        ids = self.selected_ids()
+        with self.db.transaction():
+            for task_id in ids:
+                if task_id in recurring: self.db.complete_occurrence(task_id)
+            others = [task_id for task_id in ids if task_id not in recurring]
+            if others: self.db.set_status(status, ids=others)
+
+    def archive_done(self):
+        days, ok = QInputDialog.getInt(self, "Архив", "Перенести в архив выполненные задачи старше (дней):",
+                                       ARCHIVE_DAYS, 1, 36500)
+        if ok: self.async_db.call("archive_done", days, callback=self.on_archive_done)
+
+    def on_archive_done(self, moved):
+        # Перенос шёл в рабочем потоке: удаления из tasks окно подхватывает как чужие правки
+        self.db.poll_changes()
+        if self.archive_check.isChecked(): self.apply_filters()
+        self.status_bar.showMessage(f"Перенесено в архив: {moved}", 5000)
 
     def create_backup(self):
-        try:
-            timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_name = f"{BACKUP_DIR}/tasks_backup_{timestamp}.db"
-            shutil.copy2(DB_NAME, backup_name)
-            backups = sorted([f for f in os.listdir(BACKUP_DIR) if f.startswith('tasks_backup_')])
-            for old_backup in backups[:-5]: os.remove(f"{BACKUP_DIR}/{old_backup}")
+        if not self.backup_service.start():
+            QMessageBox.information(self, "Бэкап", "Бэкап уже выполняется")
+
+    def on_backup_done(self, path, error, manual):
+        if error:
+            QMessageBox.warning(self, "Ошибка", f"Не удалось создать бэкап: {error}")
+        elif manual:
             QMessageBox.information(self, "Успех", "Бэкап создан!")
-        except:
-            QMessageBox.warning(self, "Ошибка", "Не удалось создать бэкап")
+        else:
+            self.status_bar.showMessage(f"Автоматический бэкап: {os.path.basename(path)}", 5000)
 
     def restore_backup(self):
         path, _ = QFileDialog.getOpenFileName(self, "Выберите файл", BACKUP_DIR, "Database files (*.db)")
+        if path.endswith("_archive.db"): path = path.removesuffix("_archive.db") + ".db"  # выбран файл архива пары
         if path and QMessageBox.question(self, "Подтверждение", "Продолжить?") == QMessageBox.StandardButton.Yes:
+            if not BackupService.verify(path):
+                QMessageBox.warning(self, "Ошибка", "Файл бэкапа повреждён")
+                return
             try:
-                self.db.conn.close()
-                shutil.copy2(path, DB_NAME)
-                self.db.connect()
+                # Содержимое бэкапа копируется в открытое соединение, файл базы не перезаписывается;
+                # архив - из парного файла, у бэкапов до архива текущий архив остаётся как есть
+                # (backup пишет только в main соединения, поэтому архив - через своё соединение к его файлу)
+                src = sqlite3.connect(path)
+                try:
+                    src.backup(self.db.conn)
+                finally:
+                    src.close()
+                if os.path.exists(archive_path(path)):
+                    src, dst = sqlite3.connect(archive_path(path)), connect_db(archive_path(self.db.path), timeout=30)
+                    try:
+                        src.backup(dst)
+                    finally:
+                        src.close()
+                        dst.close()
+                self.db.conn.execute("DETACH DATABASE archive")
+                attach_archive(self.db.conn, self.db.path)  # столбцы и индексы архива из старого бэкапа
+                self.db.create_table()
+                # Задача, что в бэкапе ещё в tasks, а в архиве уже есть (бэкап до переноса или перенос
+                # во время бэкапа), иначе показалась бы в режиме "с архивом" дважды
+                with self.db.conn:
+                    self.db.conn.execute("DELETE FROM archive.tasks WHERE id IN (SELECT id FROM tasks)")
+                self.db.reserve_archived_ids()
                 self.load_tasks()
+                self.reminder_scheduler.load()
                 QMessageBox.information(self, "Успех", "Данные восстановлены!")
-            except:
+            except sqlite3.Error:
                 QMessageBox.warning(self, "Ошибка", "Не удалось восстановить")
 
     def export_csv(self):
-        path, _ = QFileDialog.getSaveFileName(self, "Сохранить CSV",
-                                              f"tasks_{datetime.datetime.now().strftime('%Y%m%d_%H%M')}.csv",
-                                              "CSV files (*.csv)")
-        if path:
-            try:
-                tasks = self.db.get_tasks()
-                with open(path, "w", newline="", encoding="utf-8") as f:
-                    writer = csv.writer(f)
-                    writer.writerow(
-                        ["ID", "Название", "Описание", "Приоритет", "Статус", "Создано", "Дедлайн", "Напоминание"])
-                    writer.writerows(tasks)
-                QMessageBox.information(self, "Успех", f"Экспортировано в {path}")
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Ошибка экспорта: {e}")
+        path, selected = QFileDialog.getSaveFileName(
+            self, "Экспорт", f"tasks_{datetime.datetime.now().strftime('%Y%m%d_%H%M')}.csv",
+            "CSV files (*.csv);;JSON Lines (*.jsonl);;CSV gzip (*.csv.gz);;JSON Lines gzip (*.jsonl.gz);;"
+            "Дельта для синхронизации (*.delta.jsonl.gz)")
+        if not path: return
+        delta = "*.delta." in selected or path.endswith(".delta.jsonl.gz")
+        if not path.endswith((".csv", ".jsonl", ".csv.gz", ".jsonl.gz")):
+            path += selected[selected.index("*") + 1:-1]
+        elif delta and not path.endswith(".delta.jsonl.gz"):
+            path = path.removesuffix(".gz").removesuffix(".jsonl").removesuffix(".csv") + ".delta.jsonl.gz"
+        if delta:
+            since, ok = QInputDialog.getInt(self, "Дельта", "Изменения после ревизии (0 - все задачи):",
+                                            self.db.delta_revision(), 0)
+            if not ok: return
+            self.export_worker, total = DeltaExportWorker(path, since, parent=self), 0
+        else:
+            filters, archive = self.current_filters(), self.archive_check.isChecked()
+            query = self.db.build_filter_query(archive=archive)
+            total = self.total_tasks + (self.archived_count if archive else 0)
+            if any(filters.values()) and QMessageBox.question(
+                    self, "Экспорт", "Экспортировать только отфильтрованные задачи?") == QMessageBox.StandardButton.Yes:
+                query, total = self.db.build_filter_query(**filters, archive=archive), self.filtered_count
+            self.export_worker = ExportWorker(path, query, total, parent=self)
+        self.export_progress = QProgressDialog("Экспорт...", "Отмена", 0, max(total, 1), self)
+        self.export_progress.setWindowTitle("Экспорт")
+        self.export_progress.setMinimumDuration(500)
+        self.export_progress.canceled.connect(self.export_worker.cancel)
+        self.export_worker.progress.connect(self.on_export_progress)
+        self.export_worker.done.connect(self.on_export_done)
+        self.export_btn.setEnabled(False)
+        self.export_worker.start()
+
+    def on_export_progress(self, exported, total):
+        # Дельта узнаёт число записей только в потоке - шкала подстраивается под первое сообщение
+        self.export_progress.setMaximum(max(total, 1))
+        self.export_progress.setValue(exported)
+
+    def on_export_done(self, exported, cancelled, error):
+        self.export_progress.reset()
+        self.export_btn.setEnabled(True)
+        path = self.export_worker.path
+        self.export_worker.deleteLater()
+        self.export_worker = None
+        if error:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка экспорта: {error}")
+        elif not cancelled:
+            QMessageBox.information(self, "Успех", f"Экспортировано {exported} в {path}")
 
     def import_csv(self):
-        path, _ = QFileDialog.getOpenFileName(self, "Открыть CSV", "", "CSV files (*.csv)")
-        if path:
-            try:
-                with open(path, "r", encoding="utf-8") as f:
-                    reader = csv.reader(f)
-                    next(reader)
-                    imported = 0
-                    for row in reader:
-                        if len(row) < 5: continue
-                        title, desc, prior, stat, created = row[1:6]
-                        deadline = row[6] if len(row) > 6 else ""
-                        reminder = row[7] if len(row) > 7 else ""
-                        if not title.strip(): continue
-                        if prior not in ["Низкий", "Средний", "Высокий"]: prior = "Средний"
-                        if stat not in ["В процессе", "Готово"]: stat = "В процессе"
-                        self.db.conn.execute("INSERT INTO tasks VALUES (?,?,?,?,?,?,?,?)",
-                                             (None, title, desc, prior, stat, created, deadline, reminder))
-                        imported += 1
-                    self.db.conn.commit()
-                self.load_tasks()
-                QMessageBox.information(self, "Успех", f"Импортировано: {imported}")
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Ошибка импорта: {e}")
+        path, _ = QFileDialog.getOpenFileName(self, "Открыть CSV", "",
+                                              "CSV files (*.csv);;Дельта для синхронизации (*.delta.jsonl.gz)")
+        if not path: return
+        if path.endswith(".delta.jsonl.gz"):
+            # Дельта сама сопоставляет задачи по uuid - вопрос о дубликатах не нужен
+            self.import_worker = DeltaImportWorker(path, parent=self)
+        else:
+            skip = QMessageBox.question(self, "Импорт", "Пропускать задачи, которые уже есть в базе?")
+            self.import_worker = CsvImportWorker(path, skip_duplicates=skip == QMessageBox.StandardButton.Yes,
+                                                 parent=self)
+        self.import_progress = QProgressDialog("Импорт...", "Отмена", 0, 100, self)
+        self.import_progress.setWindowTitle("Импорт CSV")
+        self.import_progress.setMinimumDuration(0)
+        self.import_progress.canceled.connect(self.import_worker.cancel)
+        self.import_worker.progress.connect(self.on_import_progress)
+        self.import_worker.done.connect(self.on_import_done)
+        self.import_btn.setEnabled(False)
+        self.import_worker.start()
+
+    def on_import_progress(self, percent, imported, rate):
+        self.import_progress.setValue(percent)
+        self.import_progress.setLabelText(f"Импортировано: {imported} ({rate:.0f} строк/с)")
+
+    def on_import_done(self, imported, skipped, cancelled, error):
+        self.import_progress.reset()
+        self.import_btn.setEnabled(True)
+        self.import_worker.deleteLater()
+        self.import_worker = None
+        self.db.mark_seen()  # всё перечитывается целиком, построчно импорт дочитывать не нужно
+        self.load_tasks()
+        self.reminder_scheduler.load()
+        if error:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка импорта: {error}\nИмпортировано: {imported}")
+        elif cancelled:
+            QMessageBox.information(self, "Импорт прерван", f"Импортировано до отмены: {imported}")
+        else:
+            QMessageBox.information(self, "Успех", f"Импортировано: {imported}, пропущено: {skipped}")
 
     def show_stats(self):
-        tasks = self.db.get_tasks()
-        stats = StatsWindow(tasks, self)
-        stats.exec()
-
-    def check_reminders(self):
-        tasks = self.db.get_tasks()
-        now = datetime.datetime.now()
-        for task in tasks:
-            if task[7]:
-                try:
-                    reminder_time = datetime.datetime.strptime(task[7], '%Y-%m-%d %H:%M')
-                    if now >= reminder_time:
-                        reminder_key = f"{task[0]}_{task[7]}"
-                        if reminder_key not in self.shown_reminders:
-                            self.show_reminder(task)
-                            self.shown_reminders.add(reminder_key)
-                except:
-                    continue
-
-    def show_reminder(self, task):
-        msg = QMessageBox(self)
-        msg.setWindowTitle("Напоминание")
-        msg.setText(f"Напоминание:\n\n{task[1]}\n{task[2]}\nПриоритет: {task[3]}")
-        msg.addButton("Отложить 5 мин", QMessageBox.ButtonRole.AcceptRole)
-        msg.addButton("Выполнено", QMessageBox.ButtonRole.YesRole)
-        msg.addButton("Закрыть", QMessageBox.ButtonRole.RejectRole)
-        result = msg.exec()
-        if result == 0:
-            new_reminder = (datetime.datetime.now() + datetime.timedelta(minutes=5)).strftime('%Y-%m-%d %H:%M')
-            self.db.update_task(task[0], task[1], task[2], task[3], task[4], task[6], new_reminder)
-        elif result == 1:
-            self.db.update_task(task[0], task[1], task[2], task[3], "Готово", task[6], "")
-            self.load_tasks()
+        self.async_db.call("get_stats", callback=self.open_stats)
+
+    def open_stats(self, stats):
+        self.on_stats(stats)
+        StatsWindow(stats, self.db.get_weekly_throughput(), self).exec()
+
+    def show_reminders(self, task_ids):
+        # Пока окно напоминаний открыто, новые напоминания добавляются в него же
+        if not self.reminder_dialog or not self.reminder_dialog.isVisible():
+            self.reminder_dialog = ReminderDialog(self.db, self)
+        self.reminder_dialog.add_tasks(task_ids)
+        self.reminder_dialog.show()
+
+
+def run_sync(argv):
+    # Ночная синхронизация без окна: Ela.py --export-delta FILE [--since N] | --import-delta FILE
+    parser = argparse.ArgumentParser(description="Дельта-синхронизация менеджера задач Ela.py")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--export-delta", metavar="FILE")
+    group.add_argument("--import-delta", metavar="FILE")
+    parser.add_argument("--since", type=int, help="ревизия прошлой выгрузки (по умолчанию - из базы)")
+    args = parser.parse_args(argv)
+    db = TaskDB()  # миграции до uuid и надгробий
+    since = db.delta_revision() if args.since is None else args.since
+    if args.export_delta:
+        worker = DeltaExportWorker(args.export_delta, since)
+    else:
+        worker = DeltaImportWorker(args.import_delta)
+    result = []
+    worker.done.connect(lambda *values: result.append(values), type=Qt.ConnectionType.DirectConnection)
+    worker.run()
+    *counts, error = result[0]
+    revision = db.delta_revision()
+    db.close()
+    if error:
+        print(f"Ошибка: {error}", file=sys.stderr)
+        return 1
+    if args.export_delta:
+        print(f"Выгружено записей: {counts[0]}, ревизия: {revision}")
+    else:
+        print(f"Применено: {counts[0]}, без изменений: {counts[1]}")
+    return 0
 
 
 if __name__ == "__main__":
+    if any(arg.startswith(("--export-delta", "--import-delta")) for arg in sys.argv[1:]):
+        sys.exit(run_sync(sys.argv[1:]))
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
     win = MainWindow()
@@ -0,0 +1,190 @@
+import os, sys, time, json, random, argparse, datetime, statistics, sqlite3, shutil
+
+# Бенчмарки Ela.py без экрана: python bench_ela.py --sizes 1k,100k --baseline bench_baseline.json
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication
+
+import Ela
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+WORDS = ("отчёт", "встреча", "созвон", "проект", "релиз", "ошибка", "дизайн", "бюджет", "клиент", "договор",
+         "презентация", "тесты", "сервер", "база", "документация", "ревью", "план", "квартал", "оплата", "склад",
+         "поставка", "интервью", "обучение", "аналитика", "миграция", "бэкап", "календарь", "задача", "идея")
+
+
+def synthetic_task(rng, today):
+    # Распределения похожи на живую базу: много выполненного, большинство дедлайнов рядом с сегодня
+    title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).capitalize()
+    description = " ".join(rng.choice(WORDS) for _ in range(int(rng.lognormvariate(2.5, 1.0)) % 400))
+    priority = rng.choices(Ela.PRIORITIES, weights=(3, 5, 2))[0]
+    status = rng.choices(Ela.STATUSES, weights=(4, 6))[0]
+    created = today - datetime.timedelta(days=rng.randint(0, 720), minutes=rng.randint(0, 1439))
+    deadline = reminder = ""
+    if rng.random() < 0.7:
+        deadline = (today.date() + datetime.timedelta(days=int(rng.triangular(-365, 90, 0)))).isoformat()
+    if rng.random() < 0.1:
+        reminder = (today + datetime.timedelta(minutes=rng.randint(-60 * 24 * 30, 60 * 24 * 30))).strftime(
+            '%Y-%m-%d %H:%M')
+    return title, description, priority, status, created.strftime('%Y-%m-%d %H:%M'), deadline, reminder
+
+
+def generate(path, rows, seed=42, batch=10_000):
+    if os.path.exists(path): os.remove(path)
+    rng, today = random.Random(seed), datetime.datetime.now().replace(second=0, microsecond=0)
+    db = Ela.TaskDB(path)
+    for start in range(0, rows, batch):
+        with db.transaction():
+            db.conn.executemany(Ela.TaskDB.INSERT_SQL,
+                                [synthetic_task(rng, today) for _ in range(min(batch, rows - start))])
+    db.conn.execute("ANALYZE")
+    db.close()
+
+
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": round(statistics.median(times), 2), "min_ms": round(min(times), 2)}
+
+
+def wait_for(app, condition, timeout=300):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline: raise TimeoutError("бенчмарк не дождался ответа")
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def run_worker(worker):
+    # QThread.run вызывается напрямую - замеряем саму работу, а не планирование потока
+    result = []
+    worker.done.connect(lambda *args: result.append(args), type=Ela.Qt.ConnectionType.DirectConnection)
+    worker.run()
+    if result and result[0][-1]: raise RuntimeError(result[0][-1])
+
+
+def bench_size(app, label, rows, workdir, repeat, seed):
+    cache = os.path.join(workdir, f"tasks_{label}_{seed}.db")
+    if not os.path.exists(cache):
+        print(f"[{label}] генерация {rows} задач...", flush=True)
+        generate(cache, rows, seed)
+    run_dir = os.path.join(workdir, f"run_{label}")
+    shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(run_dir)
+    # Окно и рабочие потоки открывают tasks.db в текущем каталоге - работаем на копии
+    with sqlite3.connect(cache) as src, sqlite3.connect(os.path.join(run_dir, Ela.DB_NAME)) as dst:
+        src.backup(dst)
+    os.chdir(run_dir)
+
+    results, db = {}, Ela.TaskDB()
+    results["TaskDB.get_tasks"] = measure(db.get_tasks, repeat)
+    for name, filters in (("all", {}), ("status", {"status": "Готово"}), ("overdue", {"deadline": "Просроченные"}),
+                          ("week_high", {"deadline": "На этой неделе", "priority": "Высокий"}),
+                          ("search", {"search": "отчёт проект"})):
+        results[f"TaskDB.filter_tasks[{name}]"] = measure(lambda: db.filter_tasks(**filters), repeat)
+    for column, name in ((0, "id"), (3, "priority"), (6, "deadline")):
+        results[f"TaskDB.fetch_page[{name}]"] = measure(lambda: db.fetch_page({}, column, True), repeat)
+    results["TaskDB.get_stats"] = measure(db.get_stats, repeat)
+    results["TaskDB.build_index"] = measure(db.build_index, repeat)
+    index = db.build_index()
+    for name, filters in (("status", {"status": "Готово"}), ("overdue", {"deadline": "Просроченные"}),
+                          ("week_high", {"deadline": "На этой неделе", "priority": "Высокий"}),
+                          ("search", {"search": "отчёт проект"})):
+        index.searches.clear()  # первый поиск проходит по строкам, повторный берёт маску из кэша
+        results[f"TaskIndex.count[{name}]"] = measure(lambda: index.count(**filters), 1)
+        results[f"TaskDB.count_filtered[{name}]"] = measure(lambda: db.count_filtered(**filters), repeat)
+
+    win = Ela.MainWindow()
+    win.show()
+    wait_for(app, lambda: win.started_up and not win.async_db.is_busy())
+
+    def apply_filters():
+        win.apply_filters()
+        wait_for(app, lambda: not win.filter_pending)
+    results["MainWindow.apply_filters"] = measure(apply_filters, repeat)
+    tasks = db.filter_tasks()
+
+    def fill_table():
+        win.fill_table(tasks)
+        win.table.viewport().repaint()
+    results["MainWindow.fill_table"] = measure(fill_table, repeat)
+    results["CalendarWidget.load_tasks_to_calendar"] = measure(win.calendar_widget.load_tasks_to_calendar, repeat)
+    results["StatsWindow"] = measure(
+        lambda: Ela.StatsWindow(db.get_stats(), db.get_weekly_throughput(), win).deleteLater(), repeat)
+    results["ReminderScheduler.load"] = measure(win.reminder_scheduler.load, repeat)
+
+    export_path = os.path.join(run_dir, "export.csv")
+    results["export.csv"] = measure(
+        lambda: run_worker(Ela.ExportWorker(export_path, db.build_filter_query(), rows)), repeat)
+    results["export.jsonl.gz"] = measure(
+        lambda: run_worker(Ela.ExportWorker(export_path + ".jsonl.gz", db.build_filter_query(), rows)), repeat)
+    results["backup"] = measure(lambda: run_worker(Ela.BackupWorker(os.path.join(run_dir, "backup.db"))), repeat)
+    delta_path = os.path.join(run_dir, "full.delta.jsonl.gz")
+    results["export.delta[all]"] = measure(lambda: run_worker(Ela.DeltaExportWorker(delta_path, 0)), repeat)
+    # Та же база уже содержит все задачи дельты - замеряется сверка по uuid без записи
+    results["import.delta[unchanged]"] = measure(lambda: run_worker(Ela.DeltaImportWorker(delta_path)), repeat)
+    # Импорт последним: он растит базу и повлиял бы на остальные замеры
+    sample = os.path.join(run_dir, "sample.csv")
+    with open(export_path, encoding="utf-8") as src, open(sample, "w", encoding="utf-8") as dst:
+        for _, line in zip(range(10_001), src): dst.write(line)
+    results["import.csv[10k]"] = measure(lambda: run_worker(Ela.CsvImportWorker(sample)), repeat)
+    # Перенос в архив - один раз: повторный прогон уже нечего переносить
+    results["TaskDB.archive_done"] = measure(db.archive_done, 1)
+    results["TaskDB.fetch_page[deadline+archive]"] = measure(
+        lambda: db.fetch_page({}, 6, True, archive=True), repeat)
+
+    win.close()
+    db.close()
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for size, benches in results.items():
+        for name, value in benches.items():
+            old = baseline.get("results", {}).get(size, {}).get(name)
+            if not old: continue
+            ratio = value["median_ms"] / max(old["median_ms"], 0.01)
+            mark = "  РЕГРЕССИЯ" if ratio > 1 + threshold else ""
+            print(f"{size:>5} {name:<45} {old['median_ms']:>10.2f} -> {value['median_ms']:>10.2f} ms "
+                  f"x{ratio:.2f}{mark}")
+            if mark: regressions.append((size, name))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки менеджера задач Ela.py")
+    parser.add_argument("--sizes", default="1k,100k", help="размеры базы через запятую: " + ", ".join(SIZES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", default="bench_data", help="каталог для сгенерированных баз")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление, доля")
+    args = parser.parse_args()
+
+    workdir, out = os.path.abspath(args.workdir), os.path.abspath(args.out)
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    os.makedirs(workdir, exist_ok=True)
+    app = QApplication(sys.argv[:1])
+    results = {}
+    for label in args.sizes.split(","):
+        results[label] = bench_size(app, label, SIZES[label], workdir, args.repeat, args.seed)
+        print(json.dumps({label: results[label]}, ensure_ascii=False, indent=1), flush=True)
+
+    report = {"meta": {"date": datetime.datetime.now().isoformat(timespec="seconds"), "python": sys.version.split()[0],
+                       "sqlite": sqlite3.sqlite_version, "repeat": args.repeat, "seed": args.seed},
+              "results": results}
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    if baseline:
+        with open(baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()